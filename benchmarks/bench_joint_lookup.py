@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Mediapipe To Signal Tool. 
+Joint lookup benchmark: Movement.from_gram_process with the id index against the old depth-first search.
+
+Copyright (C) 2021-2023, Victor Skobov 
+All rights reserved. E-mail: <vskobov@gmail.com>.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import time
+import mp2signal.mp2s as mp2s
+from synthetic import synthetic_movement
+
+#the lookups as they were before the joints index
+def _dfs_get_joint(self, id):
+    if self.id == id: 
+        return self
+    for c in self.children:
+        res = _dfs_get_joint(c,id)
+        if res != None: 
+            return res
+
+def _dfs_get_root(self):
+    if self.parent is None:
+        return self
+    return _dfs_get_root(self.parent)
+
+def _dfs_getitem(self, id):
+    return _dfs_get_joint(_dfs_get_root(self),id)
+
+def _dfs_is_ancestor(self, id):
+    if self.parent is None:
+        return False
+    if self.parent.id == id:
+        return True
+    return _dfs_is_ancestor(self.parent,id)
+
+def time_from_gram(gram, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        mp2s.Movement(gram)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best,elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Movement.from_gram_process with and without the joints index')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    gram = mp2s.Movement(synthetic_movement(args.frames)).posegram()
+
+    indexed = (mp2s.Joint_Tree.__getitem__, mp2s.Joint_Tree._get_joint, mp2s.Joint_Tree._get_root, mp2s.Joint_Tree.is_ancestor)
+    mp2s.Joint_Tree.__getitem__ = _dfs_getitem
+    mp2s.Joint_Tree._get_joint = _dfs_get_joint
+    mp2s.Joint_Tree._get_root = _dfs_get_root
+    mp2s.Joint_Tree.is_ancestor = _dfs_is_ancestor
+    try:
+        before = time_from_gram(gram,args.repeat)
+    finally:
+        mp2s.Joint_Tree.__getitem__, mp2s.Joint_Tree._get_joint, mp2s.Joint_Tree._get_root, mp2s.Joint_Tree.is_ancestor = indexed
+    after = time_from_gram(gram,args.repeat)
+
+    print('from_gram_process, %d frames' % args.frames)
+    print('depth-first lookup: %.3f s' % before)
+    print('indexed lookup:     %.3f s' % after)
+    print('speedup:            %.1fx' % (before/after))
+
+if __name__ == '__main__':
+    main()
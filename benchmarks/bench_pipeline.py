@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Mediapipe To Signal Tool.
+Pipeline benchmark: time of every stage of Movement on synthetic clips, as JSON to compare across commits.
+
+Copyright (C) 2021-2023, Victor Skobov
+All rights reserved. E-mail: <vskobov@gmail.com>.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+import mp2signal.mp2s as mp2s
+from mp2signal.render import render_video
+from synthetic import synthetic_movement
+
+STAGES = ['datum','normalize_recursive','rotate_recursive','process','encode','decode','render']
+
+def _timed_root(method, times):
+    #the recursions call themselves joint by joint, only the outermost call (at the root) is timed
+    def timed(self, *args, **kwargs):
+        if not self.is_root():
+            return method(self,*args,**kwargs)
+        start = time.perf_counter()
+        try:
+            return method(self,*args,**kwargs)
+        finally:
+            times[method.__name__] = time.perf_counter()-start
+    return timed
+
+def time_stages(mov_dict, video_path=None):
+    #process -> datum of every joint, then normalize_recursive, which ends in rotate_recursive.
+    #The trees are built before the timers start, the stages time only the processing
+    times = {}
+    m = mp2s.Movement(verbose=False)
+    originals = (mp2s.Joint_Tree.normalize_recursive,mp2s.Joint_Tree.rotate_recursive)
+    mp2s.Joint_Tree.normalize_recursive = _timed_root(originals[0],times)
+    mp2s.Joint_Tree.rotate_recursive = _timed_root(originals[1],times)
+    try:
+        start = time.perf_counter()
+        m.process(mov_dict)
+        process = time.perf_counter()-start
+    finally:
+        mp2s.Joint_Tree.normalize_recursive, mp2s.Joint_Tree.rotate_recursive = originals
+
+    start = time.perf_counter()
+    gram = m.posegram()
+    encode = time.perf_counter()-start
+
+    decoded = mp2s.Movement(verbose=False)
+    start = time.perf_counter()
+    decoded.load_posegram(gram)
+    decode = time.perf_counter()-start
+
+    stages = {'datum':process-times['normalize_recursive'],
+              'normalize_recursive':times['normalize_recursive']-times['rotate_recursive'],
+              'rotate_recursive':times['rotate_recursive'],
+              'process':process,
+              'encode':encode,
+              'decode':decode}
+    if video_path:
+        #drawing and video encoding in this process
+        start = time.perf_counter()
+        render_video(decoded,video_path,workers=1)
+        stages['render'] = time.perf_counter()-start
+    return stages
+
+def environment():
+    try:
+        commit = subprocess.run(['git','rev-parse','--short','HEAD'],capture_output=True,text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit':commit,'python':platform.python_version(),'numpy':np.__version__,
+            'platform':platform.platform(),'cpus':os.cpu_count()}
+
+def compare(report, baseline):
+    #seconds of this run / seconds of the baseline run, for every clip length and stage in both
+    print('%-8s %-20s %10s %10s %8s' % ('frames','stage','baseline','now','ratio'))
+    for frames, stages in report['results'].items():
+        for stage, seconds in stages.items():
+            before = baseline['results'].get(frames,{}).get(stage)
+            if before:
+                print('%-8s %-20s %10.4f %10.4f %7.2fx' % (frames,stage,before,seconds,seconds/before))
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every stage of the Movement pipeline on synthetic clips')
+    parser.add_argument('--frames', type=int, nargs='+', default=[30,300,3000])
+    parser.add_argument('--repeat', type=int, default=3, help='the best of this many runs is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-render', action='store_true', help='skip the rendering, the slowest stage')
+    parser.add_argument('-o', '--out', default=None, help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', default=None, help='JSON report of an earlier run to compare with')
+    args = parser.parse_args()
+
+    report = {'environment':environment(),'repeat':args.repeat,'seed':args.seed,'results':{}}
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = os.path.join(tmp,'bench.mp4')
+        for frames in args.frames:
+            mov_dict = synthetic_movement(frames,args.seed)
+            best = {}
+            for i in range(args.repeat):
+                times = time_stages(mov_dict,None if args.no_render else video_path)
+                for stage, seconds in times.items():
+                    best[stage] = min(best.get(stage,seconds),seconds)
+            report['results'][str(frames)] = dict((s,best[s]) for s in STAGES if s in best)
+
+    if args.out:
+        with open(args.out,'w') as f:
+            json.dump(report,f,indent=2)
+    else:
+        print(json.dumps(report,indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report,json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Mediapipe To Signal Tool. 
+Synthetic mediapipe holistic landmarks for offline benchmarking.
+Builds landmark dicts shaped like Movement.movement_from_mediapipe output, without a video or mediapipe.
+
+Copyright (C) 2021-2023, Victor Skobov 
+All rights reserved. E-mail: <vskobov@gmail.com>.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import joblib
+import numpy as np
+import mp2signal.mp2s as mp2s
+
+def _trajectories(rng, t, n, center, spread, amp):
+    #n landmarks slowly moving around random positions -> (frames,n,3)
+    base = center + rng.uniform(-spread,spread,(n,3))
+    freq = rng.uniform(0.5,2,(n,3))
+    phase = rng.uniform(0,2*np.pi,(n,3))
+    return base[None] + amp*np.sin(t[:,None,None]*freq[None] + phase[None])
+
+def synthetic_movement(frames=300, seed=0, W=640, H=480):
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0,2*np.pi,frames)
+    relaxed_face = joblib.load(mp2s.RELAXED_FACE_MODEL)
+    face_template = np.array([relaxed_face[str(1000+k)][0] for k in range(468)] + [relaxed_face['1033'][0]]*10)
+
+    MP_Pose = np.zeros((frames,33,7))
+    MP_Pose[:,:,:3] = _trajectories(rng,t,33,np.array([W/2,H*0.6,0]),150,10)
+    MP_Pose[:,:,3] = 0.9
+    MP_Pose[:,:,4:] = _trajectories(rng,t,33,0,40,3)
+
+    MP_Face = np.zeros((frames,478,4))
+    MP_Face[:,:,:3] = np.array([W/2,H*0.3,0]) + face_template[None]*0.4 + _trajectories(rng,t,478,0,1,1.5)
+
+    MP_RHand = np.zeros((frames,21,4))
+    MP_RHand[:,:,:3] = _trajectories(rng,t,21,np.array([W*0.3,H*0.8,0]),40,5)
+    MP_LHand = np.zeros((frames,21,4))
+    MP_LHand[:,:,:3] = _trajectories(rng,t,21,np.array([W*0.7,H*0.8,0]),40,5)
+
+    mov_dict = {'MP_Pose':MP_Pose,
+                'MP_Face':MP_Face,
+                'MP_RHand':MP_RHand,
+                'MP_LHand':MP_LHand}
+    mov_dict['Meta'] = {'Video Path':'synthetic',
+                        'H':H,
+                        'W':W,
+                        'FPS':30,
+                        'Frames':frames}
+    return mov_dict
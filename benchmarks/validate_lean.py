@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Mediapipe To Signal Tool.
+Lean mode check: the stages a lean Movement frees before the rotation are gone when it starts, the posegrams are the
+same as the ones of a full Movement, and the peak memory of both.
+
+Copyright (C) 2021-2023, Victor Skobov
+All rights reserved. E-mail: <vskobov@gmail.com>.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import tracemalloc
+import numpy as np
+import mp2signal.mp2s as mp2s
+from synthetic import synthetic_movement
+
+#stages a lean tree no longer holds when the rotation starts
+LEAN_DROPPED = ['joint_datum']
+
+def stages_at_rotation(movement, **kwargs):
+    #Movement(movement, **kwargs), the stages alive when the root starts rotating, and the peak traced bytes
+    seen = []
+    original = mp2s.Joint_Tree.rotate_recursive
+    def rotate_recursive(self):
+        if self.is_root():
+            seen.append(sorted(self.skeleton.stages))
+        return original(self)
+    mp2s.Joint_Tree.rotate_recursive = rotate_recursive
+    tracemalloc.start()
+    try:
+        m = mp2s.Movement(movement,verbose=False,**kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        mp2s.Joint_Tree.rotate_recursive = original
+    return m, seen[0], peak
+
+def main():
+    parser = argparse.ArgumentParser(description='Check what a lean Movement frees and that its posegrams are unchanged')
+    parser.add_argument('--frames', type=int, nargs='+', default=[30,300])
+    args = parser.parse_args()
+
+    reports = {}
+    failed = []
+    for frames in args.frames:
+        movement = synthetic_movement(frames)
+        full, full_stages, full_peak = stages_at_rotation(movement)
+        lean, lean_stages, lean_peak = stages_at_rotation(movement,outputs=['uint8','float'])
+        name = 'synthetic %d frames' % frames
+        reports[name] = {'stages_at_rotation_full':full_stages,
+                         'stages_at_rotation_lean':lean_stages,
+                         'peak_bytes_full':full_peak,
+                         'peak_bytes_lean':lean_peak,
+                         'same_uint8':bool(np.array_equal(full.posegram(),lean.posegram())),
+                         'same_float':bool(np.array_equal(full.posegram(signal=True),lean.posegram(signal=True),equal_nan=True))}
+        r = reports[name]
+        if any(s in lean_stages for s in LEAN_DROPPED) or not (r['same_uint8'] and r['same_float']):
+            failed.append(name)
+    print(json.dumps(reports,indent=2))
+    if failed:
+        raise SystemExit('Lean mode check failed in: '+', '.join(failed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Mediapipe To Signal Tool. 
+Precision report: maximum angular error of the float32 pipeline and of float16 signal posegrams against float64.
+
+Copyright (C) 2021-2023, Victor Skobov 
+All rights reserved. E-mail: <vskobov@gmail.com>.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import joblib
+import numpy as np
+import mp2signal.mp2s as mp2s
+from synthetic import synthetic_movement
+
+def with_dropouts(movement, rate, seed=0):
+    #landmarks missing in a fraction rate of the frames, part by part, as mediapipe loses them
+    rng = np.random.default_rng(seed)
+    movement = dict(movement)
+    for key in ('MP_Pose','MP_Face','MP_RHand','MP_LHand'):
+        movement[key] = movement[key].copy()
+        movement[key][rng.random(len(movement[key]))<rate] = 0
+    return movement
+
+def main():
+    parser = argparse.ArgumentParser(description='Angular error of reduced precision processing against float64')
+    parser.add_argument('--frames', type=int, nargs='+', default=[30,300])
+    parser.add_argument('--dtype', default='float32')
+    parser.add_argument('--signal-dtype', default='float16')
+    parser.add_argument('--dropout', type=float, default=0.2,
+                        help='also check the synthetic clips with landmarks missing in this fraction of the frames')
+    parser.add_argument('--dropout-seeds', type=int, default=8, help='dropout clips of every length')
+    parser.add_argument('--joblib', nargs='*', default=[], help='landmark dicts to check besides the synthetic clips')
+    args = parser.parse_args()
+
+    movements = list(('synthetic %d frames' % f,synthetic_movement(f)) for f in args.frames)
+    if args.dropout:
+        movements += list(('synthetic %d frames, %g dropout, seed %d' % (f,args.dropout,seed),
+                           with_dropouts(synthetic_movement(f,seed),args.dropout,seed))
+                          for f in args.frames for seed in range(args.dropout_seeds))
+    movements += list((path,path) for path in args.joblib)
+    reports = {}
+    for name, movement in movements:
+        if isinstance(movement,str):
+            movement = joblib.load(movement)
+        reports[name] = mp2s.precision_report(movement,np.dtype(args.dtype),np.dtype(args.signal_dtype))
+    print(json.dumps(reports,indent=2))
+    #NaN cells where float64 has values (or the other way round) are failures, not precision errors
+    failed = list(name for name, r in reports.items() if r['nan_mismatch_signal'] or r['nan_mismatch_emitted'])
+    if failed:
+        raise SystemExit('NaN mismatch in: '+', '.join(failed))
+
+if __name__ == '__main__':
+    main()
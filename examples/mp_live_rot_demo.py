@@ -42,8 +42,9 @@ cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
 PAUSED = False
 
 frame_counter = 0
-b_mul = None
 ref_face = True
+#one stream for the whole session, smoothed over the last frames and shown without delay
+mt = mp2s.Movement_Stream(lag=0,face_landmarks=478 if ref_face else 468)
 with mp_holistic.Holistic(
     smooth_landmarks=True,
     model_complexity=2,
@@ -74,14 +75,6 @@ with mp_holistic.Holistic(
             #face_image = np.zeros((X_DIMENSION, Y_DIMENSION,3),dtype=np.uint8)
 
             if results:
-                if ref_face:
-                    MP_Face = np.zeros((1,478,4))
-                else:
-                    MP_Face = np.zeros((1,468,4))
-
-                MP_Pose = np.zeros((1,33,7))
-                MP_RHand = np.zeros((1,21,4))
-                MP_LHand = np.zeros((1,21,4))
                 j_list=[]
                 j_list = [2,5,3,4,6,7,
                             811,999,
@@ -96,30 +89,13 @@ with mp_holistic.Holistic(
                 r_hand=[400+k for k in range(21)]
                 j_list = j_list+l_hand+r_hand
                 j_list=[]
-                if results.face_landmarks:
-                    MP_Face[0] = mp2s.mp_frame_coords(results.face_landmarks,image_height,image_width)
                 if results.pose_landmarks and results.pose_world_landmarks:
-                    MP_Pose[0] = mp2s.mp_frame_coords(results.pose_landmarks,image_height,image_width,results.pose_world_landmarks)
-
-                if results.right_hand_landmarks:
-                    MP_RHand[0]= mp2s.mp_frame_coords(results.right_hand_landmarks,image_height,image_width)
-                if results.left_hand_landmarks:
-                    MP_LHand[0]= mp2s.mp_frame_coords(results.left_hand_landmarks,image_height,image_width)
-
-                
-                if results.pose_landmarks:
-                    mt = mp2s.Joint_Tree(mp2s.COCO_BODY_TREE)
-                    res_movement = {'MP_Pose':MP_Pose,
-                                'MP_Face':MP_Face,
-                                'MP_RHand':MP_RHand,
-                                'MP_LHand':MP_LHand}
-
-                    mt.process(res_movement,b_mul=b_mul)
-
-                    before_image = mt._draw_tree(before_image,0,False,j_list,text=["Original",'Frame:',frame_counter,'B_mul',int(mt.body_muls[0])])
-                    after_image = mt._draw_tree(after_image,0,True,j_list,text=["Rotated",'Frame:',frame_counter,'B_mul',int(mt.body_muls[0])],add_face=True)
-                    #face_image = mt._draw_face(face_image,0,[],text=["Rotated",'Frame:',frame_counter,'B_mul',int(mt.body_muls[0])])
-                    b_mul = int(mt.body_muls[0])
+                    column = mt.push_frame(results,image_height,image_width)
+                    if column is not None:
+                        fr = mt.ready_index
+                        before_image = mt._draw_tree(before_image,fr,False,j_list,text=["Original",'Frame:',frame_counter,'B_mul',int(mt.body_muls[fr])])
+                        after_image = mt._draw_tree(after_image,fr,True,j_list,text=["Rotated",'Frame:',frame_counter,'B_mul',int(mt.body_muls[fr])],add_face=True)
+                        #face_image = mt._draw_face(face_image,fr,[],text=["Rotated",'Frame:',frame_counter,'B_mul',int(mt.body_muls[fr])])
 
             else: 
                 text = 'No one is detetected'
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""
+Mediapipe To Signal Tool.
+On-disk cache of mediapipe holistic landmarks.
+Entries are keyed by the content hash of the video and the hash of the Holistic settings, so renamed or copied videos
+hit the cache and changed settings never return stale landmarks.
+
+Copyright (C) 2021-2023, Victor Skobov
+All rights reserved. E-mail: <vskobov@gmail.com>.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+import warnings
+import joblib
+
+LANDMARK_CACHE_DIR = os.environ.get('MP2SIGNAL_CACHE',os.path.join(os.path.expanduser('~'),'.cache','mp2signal'))
+#bytes, least recently used entries are evicted above it (about 2000 clips of 300 frames)
+LANDMARK_CACHE_SIZE = os.environ.get('MP2SIGNAL_CACHE_SIZE',10*1024**3)
+
+ENTRY_EXT = '.joblib'
+TMP_EXT = '.tmp'
+
+#(real path, size, mtime) -> content hash, so a video is read only once per process
+_video_hashes = {}
+
+def video_hash(video_path, chunk_size=1<<20):
+    st = os.stat(video_path)
+    memo_key = (os.path.realpath(video_path),st.st_size,st.st_mtime_ns)
+    if memo_key not in _video_hashes:
+        h = hashlib.sha1()
+        with open(video_path,'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size),b''):
+                h.update(chunk)
+        _video_hashes[memo_key] = h.hexdigest()
+    return _video_hashes[memo_key]
+
+def settings_hash(settings):
+    return hashlib.sha1(json.dumps(settings,sort_keys=True).encode()).hexdigest()[:12]
+
+def parse_size(size):
+    #'20G', '512M', '1.5T' or a number of bytes
+    if isinstance(size,(int,float)):
+        return int(size)
+    units = {'K':1024,'M':1024**2,'G':1024**3,'T':1024**4}
+    size = size.strip().upper().rstrip('B')
+    if size and size[-1] in units:
+        return int(float(size[:-1])*units[size[-1]])
+    return int(size)
+
+class Landmark_Cache:
+    #entries are <cache_dir>/<video hash[:2]>/<video hash>-<settings hash>.joblib holding the Movement landmark dict
+    def __init__(self, settings, cache_dir=LANDMARK_CACHE_DIR, max_size=LANDMARK_CACHE_SIZE):
+        self.settings = settings
+        self.settings_key = settings_hash(settings)
+        self.cache_dir = cache_dir
+        self.max_size = parse_size(max_size) if max_size is not None else None
+        #running total of the cache size, the directory is scanned only at the first put and on eviction
+        self._size = None
+
+    def path(self, video_path):
+        vh = video_hash(video_path)
+        return os.path.join(self.cache_dir,vh[:2],vh+'-'+self.settings_key+ENTRY_EXT)
+
+    def get(self, video_path):
+        entry = self.path(video_path)
+        try:
+            mov_dict = joblib.load(entry)
+            meta = mov_dict['Meta']
+        except FileNotFoundError:
+            #missing, or evicted by another process
+            return None
+        except Exception as e:
+            #truncated or corrupt entries are a miss, they are replaced by the next put
+            warnings.warn('Dropping unreadable landmark cache entry %s: %r' % (entry,e))
+            _remove(entry)
+            return None
+        #mtime is the last use for the eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        meta['Video Path'] = video_path
+        return mov_dict
+
+    def put(self, video_path, mov_dict):
+        #the entry path, or None when the cache can not be written (read only or full disk), the landmarks are
+        #then only missing from the cache
+        entry = self.path(video_path)
+        #written under a temporary name and renamed, an interrupted run never leaves a broken entry behind
+        tmp = '%s.%d%s' % (entry,os.getpid(),TMP_EXT)
+        try:
+            os.makedirs(os.path.dirname(entry),exist_ok=True)
+            joblib.dump(mov_dict,tmp)
+            os.replace(tmp,entry)
+            if self.max_size is not None:
+                if self._size is None:
+                    self._size = self.size()
+                else:
+                    self._size += os.path.getsize(entry)
+                if self._size > self.max_size:
+                    self.evict(self.max_size)
+        except OSError as e:
+            warnings.warn('Landmarks of %s are not cached: %r' % (video_path,e))
+            try:
+                _remove(tmp)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def get_or_extract(self, video_path, extract):
+        #extract() is called only on a miss, its landmark dict is stored
+        mov_dict = self.get(video_path)
+        if mov_dict is None:
+            mov_dict = extract()
+            self.put(video_path,mov_dict)
+        return mov_dict
+
+    def entries(self):
+        #[path, size, mtime, settings hash] of every finished entry, and the paths of leftover temporary files
+        entries, tmps = [], []
+        if not os.path.isdir(self.cache_dir):
+            return entries, tmps
+        for root, dirs, files in os.walk(self.cache_dir):
+            for f in files:
+                p = os.path.join(root,f)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                if f.endswith(TMP_EXT):
+                    tmps.append([p,st.st_size,st.st_mtime])
+                elif f.endswith(ENTRY_EXT):
+                    entries.append([p,st.st_size,st.st_mtime,f[:-len(ENTRY_EXT)].rsplit('-',1)[-1]])
+        return entries, tmps
+
+    def size(self):
+        return sum(e[1] for e in self.entries()[0])
+
+    def evict(self, max_size):
+        #removes the least recently used entries until the cache fits in max_size bytes
+        entries = sorted(self.entries()[0],key=lambda e: e[2])
+        total = sum(e[1] for e in entries)
+        removed = []
+        for e in entries:
+            if total <= max_size:
+                break
+            if _remove(e[0]):
+                removed.append(e[0])
+            total -= e[1]
+        self._size = total
+        return removed
+
+    def prune(self, max_size=None, max_age=None, other_settings=True, tmp_age=24*3600, current_keys=()):
+        #removes entries made with other Holistic settings, entries unused for max_age seconds,
+        #temporary files of interrupted runs older than tmp_age seconds, then evicts down to max_size bytes.
+        #current_keys: settings hashes of other settings still in use, their entries are kept
+        now = time.time()
+        current_keys = set(current_keys) | {self.settings_key}
+        entries, tmps = self.entries()
+        removed = []
+        for p, size, mtime in tmps:
+            if now-mtime > tmp_age and _remove(p):
+                removed.append(p)
+        for p, size, mtime, key in entries:
+            stale = (other_settings and key not in current_keys) or (max_age is not None and now-mtime > max_age)
+            if stale and _remove(p):
+                removed.append(p)
+        if max_size is not None:
+            removed += self.evict(parse_size(max_size))
+        for root, dirs, files in os.walk(self.cache_dir,topdown=False):
+            if root != self.cache_dir and not os.listdir(root):
+                os.rmdir(root)
+        return removed
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def main():
+    import mp2signal.mp2s as mp2s
+    parser = argparse.ArgumentParser(description='Manage the mediapipe landmark cache')
+    parser.add_argument('command', choices=['info','prune'])
+    parser.add_argument('--cache-dir', default=LANDMARK_CACHE_DIR, help='cache directory, %(default)s by default')
+    parser.add_argument('--max-size', default=None, help='evict least recently used entries above this size, e.g. 20G')
+    parser.add_argument('--max-age', type=float, default=None, help='remove entries unused for this many days')
+    parser.add_argument('--keep-other-settings', action='store_true',
+                        help='keep entries extracted with other Holistic settings or mediapipe versions')
+    args = parser.parse_args()
+
+    cache = mp2s.landmark_cache(args.cache_dir,None)
+    #the extraction keys its entries by the settings of its joint groups, all of them are current
+    current_keys = set(mp2s.landmark_cache(args.cache_dir,None,settings).settings_key
+                       for settings in mp2s.holistic_settings_variants())
+    if args.command == 'prune':
+        max_age = args.max_age*24*3600 if args.max_age is not None else None
+        removed = cache.prune(args.max_size,max_age,not args.keep_other_settings,current_keys=current_keys)
+        print('Removed %d files' % len(removed))
+    entries = cache.entries()[0]
+    current = sum(1 for e in entries if e[3] in current_keys)
+    print('%s: %d entries (%d with the current settings), %.1f MB' % (args.cache_dir,len(entries),current,
+                                                                       sum(e[1] for e in entries)/1024**2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+Mediapipe To Signal Tool.
+Headless batch export of stored posegrams to videos, contact sheets and GIF thumbnails.
+Every worker process keeps one Movement tree and loads the posegrams into it one after another.
+
+Copyright (C) 2021-2023, Victor Skobov
+All rights reserved. E-mail: <vskobov@gmail.com>.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+import cv2
+import numpy as np
+import mp2signal.mp2s as mp2s
+from mp2signal.render import render_plan, draw_frame
+from mp2signal.store import Posegram_Store, STORE_META
+
+#one tree per joint group selection in every worker process
+_worker = {}
+
+def _init_worker():
+    _worker['trees'] = {}
+    _worker['stores'] = {}
+
+def _load_gram(source):
+    #source: .npy path or [store path, clip number] -> posegram, FPS and joint groups when known
+    if isinstance(source,str):
+        return np.load(source), None, None
+    path, k = source
+    if path not in _worker['stores']:
+        _worker['stores'][path] = Posegram_Store(path)
+    store = _worker['stores'][path]
+    return np.asarray(store[k]), store.clip_meta(k)['FPS'], store.groups
+
+def _tree(gram, groups):
+    #groups None: taken from the rows of the posegram
+    if not groups:
+        groups = mp2s.posegram_joint_groups(gram)
+    key = tuple(sorted(groups)) if groups else None
+    if key not in _worker['trees']:
+        _worker['trees'][key] = mp2s.Movement(verbose=False,groups=groups)
+    return _worker['trees'][key]
+
+def contact_sheet(plan, tiles=(4,4), tile_size=200):
+    #(rows*tile_size, cols*tile_size, 3) BGR grid of evenly spaced frames
+    rows, cols = tiles
+    frames = np.linspace(0,plan['frames']-1,rows*cols).astype(int)
+    sheet = np.zeros((rows*tile_size,cols*tile_size,3),dtype=np.uint8)
+    for k, fr in enumerate(frames):
+        tile = cv2.resize(draw_frame(plan,fr),(tile_size,tile_size),interpolation=cv2.INTER_AREA)
+        r, c = divmod(k,cols)
+        sheet[r*tile_size:(r+1)*tile_size,c*tile_size:(c+1)*tile_size] = tile
+    return sheet
+
+def write_gif(plan, out_path, fps, gif_fps=10, gif_size=160):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError('GIF thumbnails need Pillow: pip install Pillow')
+    step = max(1,int(round(fps/gif_fps)))
+    images = list(Image.fromarray(cv2.cvtColor(cv2.resize(draw_frame(plan,fr),(gif_size,gif_size),
+                                                          interpolation=cv2.INTER_AREA),cv2.COLOR_BGR2RGB))
+                  for fr in range(0,plan['frames'],step))
+    images[0].save(out_path,save_all=True,append_images=images[1:],duration=int(1000*step/fps),loop=0)
+    return len(images)
+
+def _export_one(task):
+    source, out_base, size, fps, video, sheet, gif, groups = task
+    start = time.perf_counter()
+    try:
+        gram, clip_fps, store_groups = _load_gram(source)
+        if fps is None:
+            fps = clip_fps or 60
+        tree = _tree(gram,groups or store_groups)
+        tree.load_posegram(gram)
+        plan = render_plan(tree,size)
+        os.makedirs(os.path.dirname(out_base) or '.',exist_ok=True)
+        drawn = 0
+        if video:
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            out = cv2.VideoWriter(out_base+'.mp4', fourcc, fps, (size, size))
+            for fr in range(plan['frames']):
+                out.write(cv2.cvtColor(draw_frame(plan,fr),cv2.COLOR_BGR2RGB))
+            out.release()
+            drawn += plan['frames']
+        if sheet:
+            cv2.imwrite(out_base+'_sheet.png',contact_sheet(plan,sheet))
+            drawn += sheet[0]*sheet[1]
+        if gif:
+            drawn += write_gif(plan,out_base+'.gif',fps)
+        return out_base, drawn, time.perf_counter()-start, None
+    except Exception as e:
+        return out_base, 0, time.perf_counter()-start, repr(e)
+
+def list_posegrams(inputs):
+    #[source, output name relative to the output dir] from .npy files, directories of them and posegram stores
+    grams = []
+    for inp in inputs:
+        if os.path.exists(os.path.join(inp,STORE_META)):
+            store = Posegram_Store(inp)
+            grams += list([[inp,k],c['id']] for k, c in enumerate(store.meta['clips']))
+        elif os.path.isdir(inp):
+            grams += list([f[2],os.path.relpath(f[2],inp)[:-4]] for f in mp2s.get_files(inp,'.npy'))
+        else:
+            grams.append([inp,os.path.splitext(os.path.basename(inp))[0]])
+    grams.sort(key=lambda g: g[1])
+    return grams
+
+def export_posegrams(inputs, out_dir, workers=None, size=600, fps=None, video=True, sheet=None, gif=False,
+                     skip_existing=True, verbose=True, groups=None):
+    #every posegram is written to out_dir as <name>.mp4, <name>_sheet.png with sheet=(rows,cols) and <name>.gif,
+    #fps=None takes the FPS of store clips and 60 for .npy posegrams.
+    #groups: joint groups of the posegrams, by default the ones recorded in the store or told by the rows
+    if workers is None:
+        workers = os.cpu_count()
+    tasks = []
+    for source, name in list_posegrams(inputs):
+        out_base = os.path.join(out_dir,name)
+        outputs = ([out_base+'.mp4'] if video else [])+([out_base+'_sheet.png'] if sheet else [])+([out_base+'.gif'] if gif else [])
+        if skip_existing and all(os.path.exists(o) for o in outputs):
+            continue
+        tasks.append((source,out_base,size,fps,video,sheet,gif,groups))
+
+    results = []
+    frames_done = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers,initializer=_init_worker) as pool:
+        for out_base, frames, seconds, error in pool.imap_unordered(_export_one,tasks):
+            results.append((out_base,frames,seconds,error))
+            frames_done += frames
+            if verbose:
+                elapsed = time.perf_counter()-start
+                status = 'failed: '+error if error else '%d frames in %.1fs' % (frames,seconds)
+                print('[%d/%d] %s %s | %.1f frames/s' % (len(results),len(tasks),out_base,status,frames_done/elapsed))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Render stored posegrams to videos, contact sheets and GIFs')
+    parser.add_argument('inputs', nargs='+', help='.npy posegrams (uint8, float or human), directories of them '
+                                                  'searched recursively and/or posegram stores')
+    parser.add_argument('-o', '--out', required=True, help='output directory')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes, all the cores by default')
+    parser.add_argument('--size', type=int, default=600, help='width and height of the frames')
+    parser.add_argument('--fps', type=int, default=None, help='video FPS, the clip FPS of a store or 60 by default')
+    parser.add_argument('--no-video', action='store_true', help='do not write the .mp4 videos')
+    parser.add_argument('--sheet', default=None, help='also write a ROWSxCOLS contact sheet, e.g. 4x4')
+    parser.add_argument('--gif', action='store_true', help='also write a GIF thumbnail')
+    parser.add_argument('--overwrite', action='store_true', help='export posegrams that already have all the outputs')
+    parser.add_argument('--groups', choices=list(mp2s.JOINT_GROUPS), nargs='+', default=None,
+                        help='joint groups of the posegrams (extract --groups), by default from the store or the rows')
+    args = parser.parse_args()
+
+    sheet = tuple(int(t) for t in args.sheet.lower().split('x')) if args.sheet else None
+    start = time.perf_counter()
+    results = export_posegrams(args.inputs,args.out,args.workers,args.size,args.fps,not args.no_video,sheet,args.gif,
+                               skip_existing=not args.overwrite,groups=args.groups)
+    failed = list(r for r in results if r[3])
+    frames = sum(r[1] for r in results)
+    print('Done: %d posegrams, %d frames, %d failed, %.1f frames/s' % (len(results),frames,len(failed),
+                                                                       frames/(time.perf_counter()-start)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Mediapipe To Signal Tool.
+Parallel extraction of mediapipe holistic landmarks for video corpora.
+Every worker process keeps one long-lived Holistic and runs Movement.movement_from_mediapipe with it.
+
+Copyright (C) 2021-2023, Victor Skobov
+All rights reserved. E-mail: <vskobov@gmail.com>.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+import joblib
+import numpy as np
+import mediapipe as mp
+import mp2signal.mp2s as mp2s
+
+VIDEO_EXTENSIONS = ['.mp4','.MP4','.mov','.MOV']
+
+#one Holistic per worker process
+_worker = {}
+
+def _init_worker(holistic_settings, cache_dir, cache_size):
+    _worker['holistic'] = mp.solutions.holistic.Holistic(**holistic_settings)
+    _worker['cache'] = mp2s.landmark_cache(cache_dir,cache_size,holistic_settings) if cache_dir else None
+
+def _extract_one(task):
+    video_path, out_base, posegram, queue_depth, groups = task
+    start = time.perf_counter()
+    try:
+        def extract():
+            holistic = _worker['holistic']
+            if hasattr(holistic,'reset'):
+                #no landmark tracking across videos
+                holistic.reset()
+            return mp2s.Movement().movement_from_mediapipe(video_path,False,holistic,queue_depth)
+        if _worker['cache']:
+            mov_dict = _worker['cache'].get_or_extract(video_path,extract)
+        else:
+            mov_dict = extract()
+        os.makedirs(os.path.dirname(out_base) or '.',exist_ok=True)
+        joblib.dump(mov_dict,out_base+'.joblib')
+        memory = 0
+        if posegram:
+            #lean Movement, only the posegram is kept
+            m = mp2s.Movement(mov_dict,verbose=False,outputs=[posegram],groups=groups)
+            np.save(out_base+'.npy',m.posegram(human=(posegram=='human'),signal=(posegram=='float')))
+            memory = m.memory['processing']
+        return video_path, mov_dict['Meta']['Frames'], time.perf_counter()-start, None, memory
+    except Exception as e:
+        return video_path, 0, time.perf_counter()-start, repr(e), 0
+
+def list_videos(inputs, extensions=VIDEO_EXTENSIONS):
+    #[video path, output name relative to the output dir] from directories and/or video files
+    videos = []
+    for inp in inputs:
+        if os.path.isdir(inp):
+            for ext in extensions:
+                for f in mp2s.get_files(inp,ext):
+                    videos.append([f[2],os.path.relpath(f[2],inp)[:-len(ext)]])
+        else:
+            videos.append([inp,os.path.splitext(os.path.basename(inp))[0]])
+    videos.sort()
+    return videos
+
+def extract_videos(inputs, out_dir, workers=None, posegram=None, holistic_settings=None, skip_existing=True, verbose=True,
+                   queue_depth=mp2s.PIPELINE_QUEUE_DEPTH, cache_dir=mp2s.LANDMARK_CACHE_DIR,
+                   cache_size=mp2s.LANDMARK_CACHE_SIZE, groups=None):
+    #landmarks of every video are written to out_dir as <name>.joblib (loadable with Movement('<name>.joblib')),
+    #posegram = 'uint8', 'float' or 'human' additionally writes <name>.npy
+    #videos already in the landmark cache at cache_dir are not run through mediapipe again, cache_dir=None disables it
+    #groups: joint groups of the posegrams, e.g. ['body','rhand','lhand'], without 'face' Holistic skips the iris refinement
+    if holistic_settings is None:
+        holistic_settings = mp2s.holistic_settings(groups)
+    if workers is None:
+        workers = os.cpu_count()
+
+    tasks = []
+    for video_path, name in list_videos(inputs):
+        out_base = os.path.join(out_dir,name)
+        if skip_existing and os.path.exists(out_base+'.joblib'):
+            continue
+        tasks.append((video_path,out_base,posegram,queue_depth,groups))
+
+    results = []
+    frames_done = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers,initializer=_init_worker,initargs=(holistic_settings,cache_dir,cache_size)) as pool:
+        for video_path, frames, seconds, error, memory in pool.imap_unordered(_extract_one,tasks):
+            results.append((video_path,frames,seconds,error,memory))
+            frames_done += frames
+            if verbose:
+                elapsed = time.perf_counter()-start
+                status = 'failed: '+error if error else '%d frames in %.1fs' % (frames,seconds)
+                if memory:
+                    status += ', %.0f MB processing' % (memory/1024**2)
+                print('[%d/%d] %s %s | %.2f videos/s, %.1f frames/s' % (len(results),len(tasks),video_path,status,
+                                                                        len(results)/elapsed,frames_done/elapsed))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract mediapipe holistic landmarks from videos in parallel')
+    parser.add_argument('inputs', nargs='+', help='video files and/or directories searched recursively')
+    parser.add_argument('-o', '--out', required=True, help='output directory')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes, all the cores by default')
+    parser.add_argument('--posegram', choices=['uint8','float','human'], default=None, help='also save the posegram as .npy')
+    parser.add_argument('--groups', choices=list(mp2s.JOINT_GROUPS), nargs='+', default=None,
+                        help='joint groups of the posegrams, all by default, the body is always kept')
+    parser.add_argument('--overwrite', action='store_true', help='extract videos that already have an output')
+    parser.add_argument('--queue-depth', type=int, default=mp2s.PIPELINE_QUEUE_DEPTH,
+                        help='frames buffered between decoding, inference and packing, 0 runs them sequentially')
+    parser.add_argument('--cache-dir', default=mp2s.LANDMARK_CACHE_DIR, help='landmark cache, %(default)s by default')
+    parser.add_argument('--cache-size', default=mp2s.LANDMARK_CACHE_SIZE, help='landmark cache size limit, e.g. 20G')
+    parser.add_argument('--no-cache', action='store_true', help='always run mediapipe, without the landmark cache')
+    args = parser.parse_args()
+
+    results = extract_videos(args.inputs,args.out,args.workers,args.posegram,skip_existing=not args.overwrite,
+                             queue_depth=args.queue_depth,cache_dir=None if args.no_cache else args.cache_dir,
+                             cache_size=args.cache_size,groups=args.groups)
+    failed = list(r for r in results if r[3])
+    print('Done: %d videos, %d frames, %d failed' % (len(results),sum(r[1] for r in results),len(failed)))
+
+if __name__ == '__main__':
+    main()
@@ -24,8 +24,17 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import numpy as np
 import mediapipe as mp
 import joblib
+import copy
+import itertools
+import operator
 import os
+import queue
+import threading
+import time
+import tracemalloc
 import cv2
+from mp2signal.cache import Landmark_Cache, LANDMARK_CACHE_DIR, LANDMARK_CACHE_SIZE
+from mp2signal.render import render_video
 
 ### GLOBAL VARS ###
 FACE_ANGLE = np.deg2rad(72)
@@ -109,23 +118,375 @@ COCO_BODY_TREE = {  '1':[[2,5,811,999],0], # 'id' : [[children], distance to par
                     '999': [face_joints,(0.6831011424110601*0.6)],
                     '1000': [[], 0.29897091464597064], '1001': [[], 0.32189085527721384], '1002': [[], 0.27952266914881957], '1003': [[], 0.2873609389947776], '1004': [[], 0.32392557213398476], '1005': [[], 0.31243649814727226], '1006': [[], 0.2650897399291037], '1007': [[], 0.23152953545672725], '1008': [[], 0.2663235758529026], '1009': [[], 0.28106111892961877], '1010': [[], 0.32792553789926154], '1011': [[], 0.3015310422076926], '1012': [[], 0.2996023972950409], '1013': [[], 0.293626352455436], '1014': [[], 0.2944574936262247], '1015': [[], 0.30208494805859454], '1016': [[], 0.31174384412318057], '1017': [[], 0.3166101657726286], '1018': [[], 0.31560574875389136], '1019': [[], 0.3146096926587482], '1020': [[], 0.2884030212559916], '1021': [[], 0.2695854636144719], '1022': [[], 0.21883150933608136], '1023': [[], 0.22479491506516333], '1024': [[], 0.22906646564494093], '1025': [[], 0.2325599631585523], '1026': [[], 0.21350079294133412], '1027': [[], 0.2487339835060737], '1028': [[], 0.24019499933543625], '1029': [[], 0.2510712940977683], '1030': [[], 0.24917886147850357], '1031': [[], 0.23377032666747213], '1032': [[], 0.3319746235340879], '1033': [[], 0.2326844686592723], '1034': [[], 0.2398845644874901], '1035': [[], 0.24020440793399275], '1036': [[], 0.24201256542682503], '1037': [[], 0.2956774702518987], '1038': [[], 0.2975211479118537], '1039': [[], 0.2917680441743019], '1040': [[], 0.28760126970423205], '1041': [[], 0.29360609925904346], '1042': [[], 0.2865694078069726], '1043': [[], 0.28911281372655506], '1044': [[], 0.3198155034654507], '1045': [[], 0.32145253886411734], '1046': [[], 0.27083555135383586], '1047': [[], 0.22916860567459177], '1048': [[], 0.2751797868331642], '1049': [[], 0.2666172174966195], '1050': [[], 0.2504157113580905], '1051': [[], 0.3067844617037169], '1052': [[], 0.27911597467424654], '1053': [[], 0.27835273131146177], '1054': [[], 0.289785851598389], '1055': [[], 0.26413907106306966], '1056': [[], 0.22755145740205635], '1057': [[], 0.27923622652293745], '1058': [[], 0.2572428166597987], '1059': [[], 0.26893831152838077], '1060': [[], 0.27124500175642363], '1061': [[], 0.2755012725190071], '1062': [[], 0.2758165225048924], '1063': [[], 0.2828162222134548], '1064': [[], 0.26695984038255915], '1065': [[], 0.2740534727318259], '1066': [[], 0.2861260657090454], '1067': [[], 0.32162954509347624], '1068': [[], 0.2853320573787695], '1069': [[], 0.3013965506524533], '1070': [[], 0.27130906765677215], '1071': [[], 0.26687583662006803], '1072': [[], 0.2995370013973689], '1073': [[], 0.2945062098271013], '1074': [[], 0.2885831308605261], '1075': [[], 0.26607287925282896], '1076': [[], 0.2760157205596095], '1077': [[], 0.2841103061607785], '1078': [[], 0.2750003234968581], '1079': [[], 0.2932260604809033], '1080': [[], 0.28226483576536127], '1081': [[], 0.2871572000251397], '1082': [[], 0.29181732605681954], '1083': [[], 0.31517114267394053], '1084': [[], 0.31523370928650346], '1085': [[], 0.3096005573149318], '1086': [[], 0.29974752691225426], '1087': [[], 0.29286920220168927], '1088': [[], 0.2840304016063443], '1089': [[], 0.2883318529746069], '1090': [[], 0.29409818204167026], '1091': [[], 0.296721165688954], '1092': [[], 0.27387342621783556], '1093': [[], 0.22845700495235619], '1094': [[], 0.29129372918385193], '1095': [[], 0.2788872712466281], '1096': [[], 0.2816799978728051], '1097': [[], 0.27468102371262265], '1098': [[], 0.25623893299599104], '1099': [[], 0.2735680441385208], '1100': [[], 0.22785582410862668], '1101': [[], 0.23580170263495484], '1102': [[], 0.25851722296418245], '1103': [[], 0.3088474137972539], '1104': [[], 0.2963441466183404], '1105': [[], 0.2864113952139477], '1106': [[], 0.29957896658144106], '1107': [[], 0.2832342677574787], '1108': [[], 0.3025243820931178], '1109': [[], 0.3274230513180256], '1110': [[], 0.23166032330255945], '1111': [[], 0.24004556319451353], '1112': [[], 0.2100483802698624], '1113': [[], 0.24927824973173995], '1114': [[], 0.23466065245157347], '1115': [[], 0.29049028521608267], '1116': [[], 0.24421449523156588], '1117': [[], 0.24094029128101563], '1118': [[], 0.23769349162062342], '1119': [[], 0.2262273003058249], '1120': [[], 0.21955960791112736], '1121': [[], 0.21980522605507588], '1122': [[], 0.2568960220709868], '1123': [[], 0.24726972681887469], '1124': [[], 0.2556920977528406], '1125': [[], 0.31319541428660225], '1126': [[], 0.23678883309142004], '1127': [[], 0.23350784163776783], '1128': [[], 0.22140415952525408], '1129': [[], 0.24028374230638613], '1130': [[], 0.23426403422232123], '1131': [[], 0.2802012698847483], '1132': [[], 0.23951076861897688], '1133': [[], 0.2078742927906687], '1134': [[], 0.2961852504944151], '1135': [[], 0.2909542723881395], '1136': [[], 0.29600314488739554], '1137': [[], 0.23569347155496254], '1138': [[], 0.27597316047149884], '1139': [[], 0.2489766370913873], '1140': [[], 0.34404294051549217], '1141': [[], 0.2895445914267923], '1142': [[], 0.2350230862840524], '1143': [[], 0.2425732853262155], '1144': [[], 0.2287705282735886], '1145': [[], 0.22520962923738644], '1146': [[], 0.285274288355511], '1147': [[], 0.2506409650747717], '1148': [[], 0.3596643057203916], '1149': [[], 0.3307656999912546], '1150': [[], 0.3149430588778669], '1151': [[], 0.3017147714050526], '1152': [[], 0.3628790585725905], '1153': [[], 0.22033872686503078], '1154': [[], 0.21444723794969936], '1155': [[], 0.20910977852901597], '1156': [[], 0.2557563695040086], '1157': [[], 0.2216385138802922], '1158': [[], 0.2314336909788791], '1159': [[], 0.23712780827823615], '1160': [[], 0.23999936721547363], '1161': [[], 0.23891048550538768], '1162': [[], 0.24956266804378788], '1163': [[], 0.23043039395196085], '1164': [[], 0.2806111128212048], '1165': [[], 0.2724869590362323], '1166': [[], 0.27552270659733225], '1167': [[], 0.280348223606196], '1168': [[], 0.25705077526428843], '1169': [[], 0.3075752459281116], '1170': [[], 0.3241387033429568], '1171': [[], 0.3600382920186313], '1172': [[], 0.2767319719208857], '1173': [[], 0.21343592319192303], '1174': [[], 0.2591518825694803], '1175': [[], 0.36278244905531715], '1176': [[], 0.348026388676393], '1177': [[], 0.24460732644538977], '1178': [[], 0.2885938155412595], '1179': [[], 0.2946149271579142], '1180': [[], 0.3023140223346934], '1181': [[], 0.30749741252221846], '1182': [[], 0.30972560805992644], '1183': [[], 0.28110481593877984], '1184': [[], 0.28202924303494115], '1185': [[], 0.2817372869433164], '1186': [[], 0.2762929911586161], '1187': [[], 0.2578028080213777], '1188': [[], 0.24379495939408302], '1189': [[], 0.22098866838439127], '1190': [[], 0.21643459265505352], '1191': [[], 0.2768000368782006], '1192': [[], 0.2666888170664094], '1193': [[], 0.24343028538942313], '1194': [[], 0.3187015088472006], '1195': [[], 0.29371007648092834], '1196': [[], 0.2728141910161798], '1197': [[], 0.2777078901733986], '1198': [[], 0.26033229354941745], '1199': [[], 0.35170744268583354], '1200': [[], 0.3313975253443943], '1201': [[], 0.3292121084295293], '1202': [[], 0.2928587899920742], '1203': [[], 0.24586044165649062], '1204': [[], 0.30667628699357635], '1205': [[], 0.25448286153764355], '1206': [[], 0.2572669318292015], '1207': [[], 0.26335195121591826], '1208': [[], 0.3486193720729546], '1209': [[], 0.2493398403150055], '1210': [[], 0.2988584653392856], '1211': [[], 0.3134480036082128], '1212': [[], 0.28119286789568776], '1213': [[], 0.25771405612829557], '1214': [[], 0.2812234899627166], '1215': [[], 0.25871284072526024], '1216': [[], 0.2690123554656391], '1217': [[], 0.24623383291847045], '1218': [[], 0.2965383034488502], '1219': [[], 0.27805815175841003], '1220': [[], 0.30683306952453265], '1221': [[], 0.23480325211637454], '1222': [[], 0.250337951878886], '1223': [[], 0.26024244049604595], '1224': [[], 0.2634564530389425], '1225': [[], 0.2603001463491855], '1226': [[], 0.23713123418566742], '1227': [[], 0.23580978844465622], '1228': [[], 0.23213927781261923], '1229': [[], 0.22909700291366253], '1230': [[], 0.2229519321148801], '1231': [[], 0.21636136284150032], '1232': [[], 0.21318985382648759], '1233': [[], 0.21257065771194214], '1234': [[], 0.22575207017692347], '1235': [[], 0.27014205189151563], '1236': [[], 0.27418133020401136], '1237': [[], 0.3105043812594327], '1238': [[], 0.30439628303041194], '1239': [[], 0.30198493649277774], '1240': [[], 0.2646309991244043], '1241': [[], 0.3099498109173028], '1242': [[], 0.28919633095377734], '1243': [[], 0.2082312669669611], '1244': [[], 0.21577909023291397], '1245': [[], 0.2280737421976012], '1246': [[], 0.23675017303874524], '1247': [[], 0.24417045278698996], '1248': [[], 0.2874446463997888], '1249': [[], 0.2348494014643371], '1250': [[], 0.28947859846506585], '1251': [[], 0.2705817007354643], '1252': [[], 0.219107737448443], '1253': [[], 0.22544308950484077], '1254': [[], 0.23062297252307387], '1255': [[], 0.2349356351177401], '1256': [[], 0.21431886232087952], '1257': [[], 0.2504244453392782], '1258': [[], 0.24215013518115627], '1259': [[], 0.2533521865211508], '1260': [[], 0.2517713284546768], '1261': [[], 0.23643112691448845], '1262': [[], 0.33062123936508103], '1263': [[], 0.2360954653987609], '1264': [[], 0.24012154849462752], '1265': [[], 0.242751797672941], '1266': [[], 0.24490194995628234], '1267': [[], 0.2959856206347846], '1268': [[], 0.29737436607679113], '1269': [[], 0.2917981411842897], '1270': [[], 0.28705146430049505], '1271': [[], 0.2931173799895994], '1272': [[], 0.28593242938586805], '1273': [[], 0.2885315227701197], '1274': [[], 0.3207875369708608], '1275': [[], 0.32254351873265463], '1276': [[], 0.2739254502249646], '1277': [[], 0.23068910582925026], '1278': [[], 0.27741370734206716], '1279': [[], 0.2689262724794815], '1280': [[], 0.25170081718439397], '1281': [[], 0.3071107394652414], '1282': [[], 0.2831348033070644], '1283': [[], 0.282146263910447], '1284': [[], 0.2917777827545273], '1285': [[], 0.26534728964165333], '1286': [[], 0.22922964683725006], '1287': [[], 0.2784687265266037], '1288': [[], 0.251218580811986], '1289': [[], 0.2711917427787328], '1290': [[], 0.27387898222713714], '1291': [[], 0.27447771124293135], '1292': [[], 0.27472644918399874], '1293': [[], 0.2869431371915004], '1294': [[], 0.2695339254082094], '1295': [[], 0.27744151725851635], '1296': [[], 0.2897415812540241], '1297': [[], 0.3239024273433314], '1298': [[], 0.28860223719336375], '1299': [[], 0.30455446095312577], '1300': [[], 0.27459714009256875], '1301': [[], 0.26940260677717154], '1302': [[], 0.29943949487346855], '1303': [[], 0.29412370901344387], '1304': [[], 0.2881410611710916], '1305': [[], 0.26857118616154846], '1306': [[], 0.27506063809348635], '1307': [[], 0.283771875800349], '1308': [[], 0.273787070112275], '1309': [[], 0.29389104696010604], '1310': [[], 0.28141732482869725], '1311': [[], 0.28655662923730263], '1312': [[], 0.29143372873223444], '1313': [[], 0.3153728304957644], '1314': [[], 0.3154737063906793], '1315': [[], 0.3096976198995524], '1316': [[], 0.2996960390688427], '1317': [[], 0.29277202838770633], '1318': [[], 0.2837659364877235], '1319': [[], 0.2884397646044949], '1320': [[], 0.2943714836070328], '1321': [[], 0.2967900879787643], '1322': [[], 0.2750049806639789], '1323': [[], 0.22748199804569852], '1324': [[], 0.2779328925773773], '1325': [[], 0.2811695648059718], '1326': [[], 0.27611957061871806], '1327': [[], 0.25971229531627865], '1328': [[], 0.2756500763928238], '1329': [[], 0.22967913050936326], '1330': [[], 0.2382105080627384], '1331': [[], 0.261172940793423], '1332': [[], 0.31154034713941386], '1333': [[], 0.30036532735425386], '1334': [[], 0.29072427694376946], '1335': [[], 0.29883619337752215], '1336': [[], 0.2849459552210664], '1337': [[], 0.304423473688559], '1338': [[], 0.32949216621720046], '1339': [[], 0.23368154672991998], '1340': [[], 0.24204957711435982], '1341': [[], 0.21062513234064104], '1342': [[], 0.2520229182200012], '1343': [[], 0.23574325629364182], '1344': [[], 0.2923603926771835], '1345': [[], 0.24436646164204984], '1346': [[], 0.24268761940403513], '1347': [[], 0.2399083134158251], '1348': [[], 0.22810700436716558], '1349': [[], 0.22101851576726902], '1350': [[], 0.22119905543344628], '1351': [[], 0.257425921901319], '1352': [[], 0.24641525578227047], '1353': [[], 0.2580102193904131], '1354': [[], 0.3134093596614719], '1355': [[], 0.2384615874858642], '1356': [[], 0.23413796800684117], '1357': [[], 0.222372713169181], '1358': [[], 0.24346538433889683], '1359': [[], 0.2371971586259149], '1360': [[], 0.2821946594493414], '1361': [[], 0.23603419600413414], '1362': [[], 0.20838279855191433], '1363': [[], 0.2972867211456871], '1364': [[], 0.2858816963777874], '1365': [[], 0.28945461209031653], '1366': [[], 0.23444087835678357], '1367': [[], 0.27035171628555116], '1368': [[], 0.25097438981294534], '1369': [[], 0.34188401292123033], '1370': [[], 0.2901846699657251], '1371': [[], 0.23736400028037194], '1372': [[], 0.24381235560577538], '1373': [[], 0.23106403176080104], '1374': [[], 0.22633272875410823], '1375': [[], 0.284910319057354], '1376': [[], 0.24883362482984367], '1377': [[], 0.3584493087504406], '1378': [[], 0.3269506069880008], '1379': [[], 0.3095011812155092], '1380': [[], 0.22107373959865928], '1381': [[], 0.2147661372310292], '1382': [[], 0.20938255376225964], '1383': [[], 0.25783370062986893], '1384': [[], 0.22211272164633708], '1385': [[], 0.23229813659866475], '1386': [[], 0.23857589829793993], '1387': [[], 0.24217663670152922], '1388': [[], 0.24167681437930302], '1389': [[], 0.2508608089676983], '1390': [[], 0.23327237906123913], '1391': [[], 0.2742620263157011], '1392': [[], 0.2779549327368845], '1393': [[], 0.2813181973523481], '1394': [[], 0.3034663564644981], '1395': [[], 0.320811971882683], '1396': [[], 0.35908329812836315], '1397': [[], 0.2697498391055725], '1398': [[], 0.21373061929278836], '1399': [[], 0.26016747142932367], '1400': [[], 0.34527493898846445], '1401': [[], 0.24121088138170843], '1402': [[], 0.2885424736978461], '1403': [[], 0.294681967932122], '1404': [[], 0.3023251462419121], '1405': [[], 0.30739146457514877], '1406': [[], 0.30924496937181445], '1407': [[], 0.2801751057964011], '1408': [[], 0.2810558917151956], '1409': [[], 0.28071135385486734], '1410': [[], 0.27623975033744225], '1411': [[], 0.25709783753793486], '1412': [[], 0.24476497334601438], '1413': [[], 0.22233451176825544], '1414': [[], 0.21692884955489472], '1415': [[], 0.27572722830198854], '1416': [[], 0.2637237801083085], '1417': [[], 0.24420644188841553], '1418': [[], 0.31769238776362274], '1419': [[], 0.2736160203163983], '1420': [[], 0.26222317582711624], '1421': [[], 0.32905424949402307], '1422': [[], 0.2916197933371307], '1423': [[], 0.2492153573085178], '1424': [[], 0.30535801299583243], '1425': [[], 0.25696518540036645], '1426': [[], 0.25967093828610327], '1427': [[], 0.2640436167441093], '1428': [[], 0.3480509768734033], '1429': [[], 0.2514668171565071], '1430': [[], 0.29638142996672173], '1431': [[], 0.3114428151234808], '1432': [[], 0.28007653993447296], '1433': [[], 0.25481993957879207], '1434': [[], 0.27870070807229896], '1435': [[], 0.2535965233052469], '1436': [[], 0.2698085719527195], '1437': [[], 0.24740365827134572], '1438': [[], 0.297683845338127], '1439': [[], 0.28067341512352934], '1440': [[], 0.30829789678497377], '1441': [[], 0.23628249569638507], '1442': [[], 0.2529013338797679], '1443': [[], 0.263330956428856], '1444': [[], 0.2666212441678272], '1445': [[], 0.26320590977526453], '1446': [[], 0.24004215219791578], '1447': [[], 0.2352552097879248], '1448': [[], 0.23464258090368315], '1449': [[], 0.23134207934867287], '1450': [[], 0.22451091736110804], '1451': [[], 0.2174721939326344], '1452': [[], 0.21460846419653667], '1453': [[], 0.21375967260725265], '1454': [[], 0.22575207017692347], '1455': [[], 0.2727684228920949], '1456': [[], 0.27503637528716735], '1457': [[], 0.3118353234239305], '1458': [[], 0.30550031486301726], '1459': [[], 0.30308276335110307], '1460': [[], 0.267713336114065], '1461': [[], 0.3107750080147737], '1462': [[], 0.2901356448738235], '1463': [[], 0.2092754139355229], '1464': [[], 0.21687201932915684], '1465': [[], 0.22911971988064916], '1466': [[], 0.23979174819467683], '1467': [[], 0.24730243642198935]}
 
+#mediapipe holistic settings used for the extraction
+HOLISTIC_SETTINGS = {'smooth_landmarks':True,
+                     'model_complexity':2,
+                     'min_detection_confidence':0.1,
+                     'refine_face_landmarks':True, #MP_Face has 478 landmarks
+                     'min_tracking_confidence':0.1}
+
+#frames waiting between the decoding, inference and packing stages of the extraction
+PIPELINE_QUEUE_DEPTH = 8
+
+#frames kept by Movement_Stream and the delay of its columns, 2 frames complete the 5 frame smoothing
+STREAM_WINDOW = 16
+STREAM_LAG = 2
+
 base_dir = os.path.dirname(__file__)
 RELAXED_FACE_MODEL = os.path.join(base_dir,'relaxed_face.joblib')
 
+#process-wide caches, filled on first use: the relaxed face table and one prebuilt tree per Body_Dict
+_RELAXED_FACE = {}
+_SKELETON_TEMPLATES = {}
+_GROUP_BODY_DICTS = {}
+_BODY_DICT_KEYS = {}
+
 ### CLASSES ###
+def joint_group(id):
+    #body, rhand, lhand or face (the head 999 and the face landmarks)
+    if id >= 400 and id < 500:
+        return 'rhand'
+    if id >= 700 and id < 800:
+        return 'lhand'
+    if id >= 999:
+        return 'face'
+    return 'body'
+
+JOINT_GROUPS = ('body','rhand','lhand','face')
+
+class Posegram_Layout:
+    #rows of the posegrams of a tree: the relative angles of the level>=3 joints, then the x, y and z rows of every
+    #joint in preorder (human posegrams: the relative rows, then one RGB row per joint).
+    #Posegrams without the relative rows (3*joints or joints rows) are taken as well. The accessors return views into
+    #the posegram, except group() for groups that are not contiguous in the preorder (the body)
+    def __init__(self, ids, levels):
+        self.ids = np.asarray(ids)
+        self.rel_ids = self.ids[np.asarray(levels)>=3]
+        self.rel = len(self.rel_ids)
+        self.joints = len(self.ids)
+        self.rows = self.rel + 3*self.joints
+        self.human_rows = self.rel + self.joints
+        groups = np.array(list(joint_group(int(i)) for i in self.ids))
+        self.groups = dict((g,np.flatnonzero(groups==g)) for g in JOINT_GROUPS)
+        #trimmed posegrams keep the joints before the first face landmark (body, hands, head and the anchors 1001, 1006)
+        face_rest = np.flatnonzero((self.ids>999)&(self.ids!=1001)&(self.ids!=1006))
+        self.trimmed = int(face_rest[0]) if len(face_rest) else self.joints
+
+    def rel_offset(self, gram):
+        #first joint row of the posegram
+        rows = gram.shape[0]
+        if (gram.ndim==3 and rows==self.human_rows) or (gram.ndim==2 and rows==self.rows):
+            return self.rel
+        if (gram.ndim==3 and rows==self.joints) or (gram.ndim==2 and rows==3*self.joints):
+            return 0
+        raise ValueError('A posegram of %d rows does not match the layout of %d joints' % (rows,self.joints))
+
+    def relative(self, gram):
+        #(rel,frames[,3]) relative angle rows
+        return gram[:self.rel_offset(gram)]
+
+    def angles(self, gram):
+        #(3,joints,frames) x, y and z rows of every joint, (joints,frames,3) for human posegrams
+        r = self.rel_offset(gram)
+        if gram.ndim==3:
+            return gram[r:]
+        return gram[r:r+3*self.joints].reshape((3,self.joints)+gram.shape[1:])
+
+    def group(self, gram, name):
+        #rows of the joints of a group: (3,group joints,frames), (group joints,frames,3) for human posegrams
+        joints = self.groups[name]
+        if len(joints) and joints[-1]-joints[0]+1==len(joints):
+            joints = slice(joints[0],joints[-1]+1)
+        angles = self.angles(gram)
+        return angles[joints] if gram.ndim==3 else angles[:,joints]
+
+    def trim(self, gram):
+        #(3,trimmed joints,frames) rows kept by trim_posegram, (trimmed joints,frames,3) for human posegrams
+        if gram.ndim==3:
+            return self.angles(gram)[:self.trimmed]
+        return self.angles(gram)[:,:self.trimmed]
+
+class Skeleton_Arrays:
+    #flat storage of a whole tree: one contiguous (frames,joints,channels) array per stage,
+    #joints in the preorder of Joint_Tree iteration (the posegram row order)
+    def __init__(self, joints):
+        self.ids = np.array(list(j.id for j in joints))
+        self.index = dict((j.id,k) for k,j in enumerate(joints))
+        self.parent_index = np.array(list(self.index[j.parent.id] if j.parent else -1 for j in joints))
+        self.levels = np.array(list(j.level for j in joints))
+        self.dist_to_parent = np.array(list(j.dist_to_parent for j in joints))
+        self.rel_joints, self.rel_vertex, self.rel_end = relative_angle_index(joints,self.index)
+        self.layout = Posegram_Layout(self.ids,self.levels)
+        #precision of the float stages
+        self.dtype = np.dtype(np.float64)
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.widths = {}
+        self.assigned = {}
+
+    def get(self, stage, k):
+        if stage not in self.stages or self.assigned[stage][k]==False:
+            raise AttributeError(stage)
+        if self.stages[stage].ndim==2:
+            return self.stages[stage][:,k]
+        return self.stages[stage][:,k,:self.widths[stage][k]]
+
+    def set(self, stage, k, value, channels, dtype=None):
+        value = np.asarray(value)
+        if dtype is None:
+            dtype = self.dtype
+        if stage not in self.stages or self.stages[stage].shape[0]!=value.shape[0]:
+            if value.ndim==1:
+                shape = (value.shape[0],len(self.ids))
+            else:
+                shape = (value.shape[0],len(self.ids),channels)
+            self.stages[stage] = np.zeros(shape,dtype=dtype)
+            self.widths[stage] = np.zeros(len(self.ids),dtype=int)
+            self.assigned[stage] = np.zeros(len(self.ids),dtype=bool)
+        if value.ndim==1:
+            self.stages[stage][:,k] = value
+        else:
+            self.stages[stage][:,k,:value.shape[1]] = value
+            self.stages[stage][:,k,value.shape[1]:] = 0
+            self.widths[stage][k] = value.shape[1]
+        self.assigned[stage][k] = True
+
+    def set_joints(self, stage, joints, value):
+        #value (frames,len(joints)[,channels]) for several joints at once
+        value = np.asarray(value)
+        if stage not in self.stages or self.stages[stage].shape[0]!=value.shape[0]:
+            dtype = self.dtype if value.dtype.kind=='f' else value.dtype
+            self.stages[stage] = np.zeros((value.shape[0],len(self.ids))+value.shape[2:],dtype=dtype)
+            self.widths[stage] = np.zeros(len(self.ids),dtype=int)
+            self.assigned[stage] = np.zeros(len(self.ids),dtype=bool)
+        self.stages[stage][:,joints] = value
+        if value.ndim==3:
+            self.widths[stage][joints] = value.shape[2]
+        self.assigned[stage][joints] = True
+
+    def delete(self, stage, k):
+        if stage not in self.stages or self.assigned[stage][k]==False:
+            raise AttributeError(stage)
+        self.assigned[stage][k] = False
+
+    def stage(self, stage, joints=None):
+        #the whole (frames,joints,channels) array of a stage, all the joints have to be computed
+        if joints is None:
+            joints = slice(None)
+        if stage not in self.stages or all(self.assigned[stage][joints])==False:
+            raise AttributeError(stage)
+        return self.stages[stage][:,joints]
+
+    def drop(self, stage):
+        #frees a whole stage
+        for d in (self.stages,self.widths,self.assigned):
+            d.pop(stage,None)
+
+    def nbytes(self):
+        return sum(a.nbytes for a in self.stages.values())
+
+class Joint_Stage:
+    #Joint_Tree attribute stored as a view into the Skeleton_Arrays of its tree,
+    #float stages (dtype None) take the precision of the tree
+    def __init__(self, channels=3, default=None, dtype=None):
+        self.channels = channels
+        self.default = default
+        self.dtype = dtype
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, joint, owner=None):
+        if joint is None:
+            return self
+        try:
+            return joint.skeleton.get(self.name,joint.skeleton_index)
+        except AttributeError:
+            if self.default is not None:
+                return list(self.default)
+            raise AttributeError(self.name)
+
+    def __set__(self, joint, value):
+        if len(value)==0:
+            if hasattr(joint,'skeleton') and hasattr(joint,self.name):
+                self.__delete__(joint)
+            return
+        joint.skeleton.set(self.name,joint.skeleton_index,value,self.channels,self.dtype)
+
+    def __delete__(self, joint):
+        joint.skeleton.delete(self.name,joint.skeleton_index)
+
+class Process_Profile:
+    #opt-in instrumentation of the processing: wall time, frames and allocated bytes of every joint step,
+    #stages 'datum', 'normalize_recursive', 'rotate_recursive' joint by joint, 'relative_angles', 'decode' and 'encode'
+    #for all the joints at once. Every record is also passed to callback(record), e.g. to export it to a metrics system.
+    #memory: bytes are traced with tracemalloc (slower), False records only time and frames
+    def __init__(self, callback=None, memory=True):
+        self.callback = callback
+        self.memory = memory
+        self.records = []
+        self.runs = 0
+        self.frames = 0
+        self._tracing = False
+
+    def begin(self, frames=None):
+        #frames: a new run over the clip, None for a step on what is already processed
+        if frames is not None:
+            self.runs += 1
+            self.frames += frames
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    def end(self):
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def start(self):
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            return time.perf_counter(), tracemalloc.get_traced_memory()[0]
+        return time.perf_counter(), None
+
+    def stop(self, mark, stage, joint=None, frames=0):
+        #joint None: a step over all the joints at once
+        seconds = time.perf_counter()-mark[0]
+        record = {'stage':stage,
+                  'group':joint_group(joint.id) if joint is not None else 'all',
+                  'joint':joint.id if joint is not None else None,
+                  'frames':frames,
+                  'seconds':seconds,
+                  'bytes':None,
+                  'peak_bytes':None}
+        if mark[1] is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            #kept by the step / the most it used at once
+            record['bytes'] = current-mark[1]
+            record['peak_bytes'] = peak-mark[1]
+        self.records.append(record)
+        if self.callback:
+            self.callback(record)
+
+    def summary(self):
+        #{stage: {group: {'seconds', 'bytes', 'peak_bytes', 'steps'}}} over all the runs,
+        #with the number of runs and the frames they processed
+        stages = {}
+        for r in self.records:
+            g = stages.setdefault(r['stage'],{}).setdefault(r['group'],{'seconds':0.0,'bytes':None,'peak_bytes':None,'steps':0})
+            g['seconds'] += r['seconds']
+            g['steps'] += 1
+            if r['bytes'] is not None:
+                g['bytes'] = (g['bytes'] or 0)+r['bytes']
+                g['peak_bytes'] = max(g['peak_bytes'] or 0,r['peak_bytes'])
+        return {'runs':self.runs,'frames':self.frames,'stages':stages}
+
+    def slowest(self, n=10):
+        return sorted(self.records,key=lambda r: r['seconds'],reverse=True)[:n]
+
 class Joint_Tree:
-    def __init__(self, Body_Dict=COCO_BODY_TREE, id=1, parent=None):
+    joint_datum = Joint_Stage(7,default=[])
+    normed_coords = Joint_Stage(4)
+    basic_normalization_coords = Joint_Stage(3)
+    rotated_coords = Joint_Stage(3)
+    head_origin_normed = Joint_Stage(4)
+    face_rotated_coords = Joint_Stage(3)
+    signal = Joint_Stage(3)
+    color = Joint_Stage(3,dtype=np.uint8)
+    rel_a = Joint_Stage(None)
+
+    #lean trees skip what the posegrams do not need (basic normalization, head origin coords, relative colors)
+    lean = False
+    #Process_Profile of the tree, None for no instrumentation
+    profile = None
+    #(clips+1,) first frame of every clip when several clips are processed as one, see Movement_Batch
+    clip_offsets = None
+
+    @property
+    def layout(self):
+        #Posegram_Layout of the posegrams of this tree
+        return self.root.skeleton.layout
+
+    #attributes describing the tree itself and its settings, everything else is the processed input.
+    #Subclasses add their own settings, reset() keeps the ones of the class of the root
+    _structure = ('id','level','root','ancestors','parent','BT','children','dist_to_parent',
+                  'relaxed_face','joints_index','skeleton','skeleton_index','lean','profile')
+
+    #dtype: precision of the processing and of the stored stages, np.float32 halves the memory
+    #groups: joint groups to process, e.g. ('body','rhand','lhand'), all by default. The joints of the other groups
+    #are left out of the tree, they are never computed, stored nor written to the posegrams (see select_joint_groups)
+    def __init__(self, Body_Dict=COCO_BODY_TREE, id=1, parent=None, dtype=np.float64, groups=None):
+        if parent is None:
+            #the root clones the cached template instead of rebuilding the tree
+            skeleton_template(select_joint_groups(Body_Dict,groups),id)._clone_into(self)
+            self.skeleton.dtype = np.dtype(dtype)
+        else:
+            self._build(Body_Dict,id,parent)
+
+    def _build(self, Body_Dict, id, parent):
         self.id = id
         if parent:
             self.level = parent.level+1
+            self.root = parent.root
+            self.ancestors = parent.ancestors | {parent.id}
         else:
             self.level = 0
-            self.relaxed_face = joblib.load(RELAXED_FACE_MODEL)
+            self.relaxed_face = get_relaxed_face()
+            self.root = self
+            self.ancestors = frozenset()
         self.parent = parent
         self.BT = Body_Dict
         self.children = list([Joint_Tree(Body_Dict,int(c),self) for c in Body_Dict[str(self.id)][0]])
-        self.joint_datum = []        
         self.dist_to_parent = Body_Dict[str(self.id)][1]
+        if parent is None:
+            joints = self._get_all_joints()
+            #id -> joint index for constant time lookups
+            self.joints_index = dict((j.id,j) for j in joints)
+            skeleton = Skeleton_Arrays(joints)
+            for k in range(len(joints)):
+                joints[k].skeleton = skeleton
+                joints[k].skeleton_index = k
+
+    def _clone_into(self, joint, parent=None):
+        #copies the structure of this tree into joint, sharing the read-only parts
+        joint.__dict__.update(self.__dict__)
+        joint.parent = parent
+        if parent is None:
+            joint.root = joint
+            joint.skeleton = copy.copy(self.skeleton)
+            joint.skeleton.reset()
+        else:
+            joint.root = parent.root
+            joint.skeleton = parent.skeleton
+        joint.children = list(c._clone_into(Joint_Tree.__new__(Joint_Tree),joint) for c in self.children)
+        if parent is None:
+            joint.joints_index = dict((j.id,j) for j in joint)
+        return joint
+
+    def memory_usage(self):
+        #bytes held by the processed tree: the stage arrays and the other arrays of the joints
+        joint_arrays = sum(v.nbytes for j in self.root for v in j.__dict__.values() if isinstance(v,np.ndarray))
+        return {'stages':int(self.root.skeleton.nbytes()),'joint_arrays':int(joint_arrays)}
+
+    def free_arrays(self):
+        #drops the stages and the arrays of all the joints, the settings of the tree are kept
+        self.root.skeleton.reset()
+        structure = self.root._structure
+        for j in self.root:
+            for k in list(j.__dict__):
+                if isinstance(j.__dict__[k],np.ndarray) and k not in structure:
+                    del j.__dict__[k]
+
+    def reset(self):
+        #drops everything computed from the input, the tree can be reused for a new one
+        self.root.skeleton.reset()
+        structure = self.root._structure
+        for j in self.root:
+            for k in list(j.__dict__):
+                if k not in structure:
+                    del j.__dict__[k]
 
     def _get_all_joints(self):
         #preorder iterration
@@ -143,9 +504,29 @@ class Joint_Tree:
         return int(MP_2_COCO_MAP[str(id)])
 
     def process(self, sign_mov, b_mul = None):
+        profile = self.root.profile
+        if profile and self.is_root():
+            #the profile run is ended (and tracemalloc stopped) even when a step raises
+            profile.begin(len(sign_mov['MP_Pose']))
+            try:
+                return self._process(sign_mov,b_mul)
+            finally:
+                profile.end()
+        return self._process(sign_mov,b_mul)
+
+    def _process(self, sign_mov, b_mul = None):
         #print('Process Tr',self.id)
         #if sign_mov['Meta']:
         #    self.meta = sign_mov['Meta']
+        profile = self.root.profile
+        if self.is_root():
+            self.frames = len(sign_mov['MP_Pose'])
+        if profile:
+            mark = profile.start()
+        if self.is_root():
+            self.skeleton.reset()
+            #landmarks are taken in the precision of the tree
+            sign_mov = dict((k,np.asarray(v,dtype=self.skeleton.dtype) if k.startswith('MP_') else v) for k, v in sign_mov.items())
         if hasattr(self,'normed_coords'):
             delattr(self,'normed_coords')
             delattr(self,'rotated_coords')
@@ -178,6 +559,9 @@ class Joint_Tree:
 
                 if hasattr(self,'body_muls')==False:
                     self.body_muls=np.array([98.0])
+            elif b_mul and not np.any(sign_mov['MP_Face']):
+                #no face to measure the body with
+                self.body_muls = np.full(len(sign_mov['MP_Pose']),float(b_mul))
             else:
                self.body_muls = self._get_body_multiplier(sign_mov['MP_Face'])
 
@@ -197,6 +581,8 @@ class Joint_Tree:
                 self.joint_datum = self._get_datum(sign_mov['MP_Face'],1000,additional_datum=sign_mov['MP_Pose'])
         else:
             self.joint_datum = self._get_datum(sign_mov['MP_Pose'])
+        if profile:
+            profile.stop(mark,'datum',self,self.root.frames)
 
         if self.is_leaf() == False:
             for i in range(len(self.children)):
@@ -241,10 +627,14 @@ class Joint_Tree:
 
     def normalize_recursive(self):
         #print('Norm Rec Tr',self.id)
+        profile = self.root.profile
+        if profile:
+            mark = profile.start()
         if self.is_root(): # '1" point as origin
             self.normed_coords = np.zeros((self.joint_datum.shape[0],4))
             self.normed_coords[:,-1] = np.ones(self.normed_coords.shape[0])
-            self.basic_normalization_coords = np.zeros((self.joint_datum.shape[0],3))
+            if self.lean==False:
+                self.basic_normalization_coords = np.zeros((self.joint_datum.shape[0],3))
         elif self.id >= 400 and self.id < 500:
             #RIGHT HAND
             self._get_normed_datum_coords_hand(ancestor=4)
@@ -260,26 +650,36 @@ class Joint_Tree:
         else:
             self._get_normed_datum_coords()
             self._get_basic_normalization_coords()
+        if profile:
+            profile.stop(mark,'normalize_recursive',self,self.root.frames)
 
         if self.is_leaf() == False:
             for i in range(len(self.children)):
                 self.children[i].normalize_recursive()
         else:
             if self.id==self.last_joint_id:
+                if self.root.lean:
+                    #the rotation needs only the normed coords
+                    self.skeleton.drop('joint_datum')
                 self._get_root().rotate_recursive()
             return
 
     def rotate_recursive(self):
         #print('Rotate Tr',self.id)
-        self._alpha = np.zeros((len(self.joint_datum)))
-        self._beta = np.zeros((len(self.joint_datum)))
-        self._gamma = np.zeros((len(self.joint_datum)))
-        self.rel_a = np.zeros((self.joint_datum.shape[0]))
+        profile = self.root.profile
+        if profile:
+            mark = profile.start()
+        frames = self.root.frames
+        self._alpha = np.zeros((frames))
+        self._beta = np.zeros((frames))
+        self._gamma = np.zeros((frames))
+        self.rel_a = np.zeros((frames))
         if self.is_root(): # '1" point as origin
-            self.rotated_coords = np.zeros((self.joint_datum.shape[0],3))
-            self.color = np.vstack((angle_to_uint8(self._alpha),angle_to_uint8(self._beta),angle_to_uint8(self._gamma))).T
+            self.rotated_coords = np.zeros((frames,3))
+            self.color = angle_to_uint8(np.vstack((self._alpha,self._beta,self._gamma)).T)
             self.signal = np.vstack((self._alpha,self._beta,self._gamma)).T
-            self.relative_color = angle_to_uint8(self.rel_a)
+            if self.lean==False:
+                self.relative_color = angle_to_uint8(self.rel_a)
         elif self.id >= 400 and self.id < 500:
             #RIGHT HAND
             self._h_transform_coords(4,400)
@@ -293,24 +693,38 @@ class Joint_Tree:
             self._f_transform_coords()
         else:
             self._transform_coords()
+        if profile:
+            profile.stop(mark,'rotate_recursive',self,frames)
 
         if self.is_leaf() == False:
             for i in range(len(self.children)):
                 self.children[i].rotate_recursive()
-        else:
+        if self.is_root():
+            if profile:
+                mark = profile.start()
+            self._get_relative_angles()
+            if profile:
+                profile.stop(mark,'relative_angles',None,frames)
+        return
+
+    def _get_relative_angles(self):
+        #rel_a of every level>=3 joint and frame at once, from the rotated coords of the whole tree
+        sk = self.skeleton
+        rotated_coords = sk.stage('rotated_coords')
+        vertex = rotated_coords[:,sk.rel_vertex]
+        rel_a = nangle_rad(rotated_coords[:,sk.rel_joints]-vertex,rotated_coords[:,sk.rel_end]-vertex)
+        sk.set_joints('rel_a',sk.rel_joints,rel_a)
+        if self.lean:
             return
+        for k in range(len(sk.rel_joints)):
+            self[int(sk.ids[sk.rel_joints[k]])].relative_color = relative_angle_to_RGB_uint8(rel_a[:,k])
+        return
 
     def is_ancestor(self, id):
-        if self.is_root()==False:
-            if self.parent.id == id:
-                return True
-            else: 
-                return self.parent.is_ancestor(id)
-        else: 
-            return False
+        return id in self.ancestors
 
     def __getitem__(self,id):
-        return self._get_root()._get_joint(id)
+        return self.root.joints_index.get(id)
 
     def is_root(self):
         if self.parent == None:
@@ -335,22 +749,13 @@ class Joint_Tree:
         return self.id
 
     def _get_joint(self, id):
-
-        if self.id == id: 
-            #print('Found ',id,' in ', self.parent.id)
-            return self
-
-        res = None
-        for c in self.children:
-            res = c._get_joint(id)
-            if res != None: 
-                return res
+        #only joints from this subtree
+        res = self.root.joints_index.get(id)
+        if res is self or (res != None and res.is_ancestor(self.id)):
+            return res
 
     def _get_root(self):
-        if self.is_root()==True: 
-            return self 
-        else: 
-            return self.parent._get_root()            
+        return self.root
     
     def _get_body_multiplier(self, face_datum):
 
@@ -362,7 +767,15 @@ class Joint_Tree:
         #eye_ratio = 0.15
         eye_ratio = 0.237
         bm = eye_distance / eye_ratio
-        if len(bm)>1:
+        if self.root.clip_offsets is not None:
+            #clip by clip, a single frame clip takes the default as in process
+            for a, b in zip(self.root.clip_offsets[:-1],self.root.clip_offsets[1:]):
+                clip = bm[a:b]
+                if len(clip)>1:
+                    clip[clip<1] = np.interp(np.argwhere(clip<1).reshape(-1),np.argwhere(clip>=1).reshape(-1),clip[clip>=1])
+                elif len(clip)==1 and clip[0]<=1:
+                    clip[0] = 98.0
+        elif len(bm)>1:
             intr = np.interp(np.argwhere(bm<1).reshape(-1),np.argwhere(bm>=1).reshape(-1),bm[bm>=1])
             bm[np.argwhere(bm<1).reshape(-1)] = intr
 
@@ -380,7 +793,6 @@ class Joint_Tree:
         return bm
 
     def _get_datum(self, datum, mediator=0, additional_datum=[]):      
-        _or_datum = np.zeros(datum.shape)
         if self.is_root()==False:
             if mediator==0:
                 _mp_id= self._mp_pose_convert(self.id)
@@ -419,9 +831,8 @@ class Joint_Tree:
         y_i = self.joint_datum[:,1]-self.parent.joint_datum[:,1]
         z_i = self.joint_datum[:,2]-self.parent.joint_datum[:,2]
 
-        x_i = x_i if len(x_i)==1 else interpolate_zeros(x_i)
-        y_i = y_i if len(y_i)==1 else interpolate_zeros(y_i)  
-        z_i = z_i if len(z_i)==1 else interpolate_zeros(z_i)  
+        if len(x_i)!=1:
+            x_i, y_i, z_i = interpolate_zeros(np.vstack((x_i,y_i,z_i)).T,segments=self.root.clip_offsets).T
 
         x_i = x_i + self.parent.normed_coords[:,0] 
         y_i = y_i + self.parent.normed_coords[:,1]   
@@ -450,9 +861,8 @@ class Joint_Tree:
             if _z_i[i]<0:
                 z_i[i] = -z_i[i]
         
-        x_i = x_i if len(x_i)==1 else smooth_out(x_i,5,1)
-        y_i = y_i if len(y_i)==1 else smooth_out(y_i,5,1)
-        z_i = z_i if len(z_i)==1 else smooth_out(z_i,5,1)
+        if len(x_i)!=1:
+            x_i, y_i, z_i = smooth(np.vstack((x_i,y_i,z_i)).T,5,segments=self.root.clip_offsets).T
 
         x_i = x_i + self.parent.normed_coords[:,0]   
         y_i = y_i + self.parent.normed_coords[:,1]   
@@ -548,9 +958,7 @@ class Joint_Tree:
                 z_i = z_i * self._get_root()._get_joint(ancestor*100)._d
                 #x_i = x_i * self._get_root()._get_joint(ancestor*100)._dd
 
-                x_i = smooth_out(x_i,5,1)
-                y_i = smooth_out(y_i,5,1)
-                z_i = smooth_out(z_i,5,1)
+                x_i, y_i, z_i = smooth(np.vstack((x_i,y_i,z_i)).T,5,segments=self.root.clip_offsets).T
 
                 x_i = x_i + self.parent.normed_coords[:,0]   
                 y_i = y_i + self.parent.normed_coords[:,1]   
@@ -576,9 +984,8 @@ class Joint_Tree:
             if _z_i[i]<0:
                 z_i[i] = -z_i[i]
         
-        x_i = x_i if len(x_i)==1 else smooth_out(x_i,5,1)
-        y_i = y_i if len(y_i)==1 else smooth_out(y_i,5,1)
-        z_i = z_i if len(z_i)==1 else smooth_out(z_i,5,1)
+        if len(x_i)!=1:
+            x_i, y_i, z_i = smooth(np.vstack((x_i,y_i,z_i)).T,5,segments=self.root.clip_offsets).T
 
         x_i = x_i + self.parent.normed_coords[:,0]   
         y_i = y_i + self.parent.normed_coords[:,1]   
@@ -590,6 +997,8 @@ class Joint_Tree:
         return
 
     def _get_basic_normalization_coords(self):
+        if self.root.lean:
+            return
             
         x_i = (self.joint_datum[:,0]-self._get_root().joint_datum[:,0]) / self._get_root().shoulder_distance_for_basic_normalization
         y_i = (self.joint_datum[:,1]-self._get_root().joint_datum[:,1]) / self._get_root().shoulder_distance_for_basic_normalization
@@ -605,7 +1014,7 @@ class Joint_Tree:
 
     def _get_rotated_coords(self, body_ancestor=0):
         if body_ancestor==0:
-            target_coords = np.zeros(self.normed_coords.shape)
+            target_coords = np.zeros(self.normed_coords.shape,dtype=self.normed_coords.dtype)
 
             if self.id == 2:
                 target_coords[:,0] = -self.dist_to_parent * self._get_root().body_muls
@@ -614,83 +1023,85 @@ class Joint_Tree:
                 target_coords[:,0] = self.dist_to_parent * self._get_root().body_muls
 
             target_coords[:,-1] = np.ones(target_coords.shape[0])
-            rotated_coords = np.zeros((target_coords.shape[0],3))
-            scale_coeffs = np.zeros((target_coords.shape[0]))
-            rotation_mtrxs = np.zeros((target_coords.shape[0],4,4))
-            for i in range(target_coords.shape[0]):
-                rotation_mtrxs[i] = get_rotation_mat(self.normed_coords[i], target_coords[i])
-                rotated_c = rotate(self.normed_coords[i],rotation_mtrxs[i])
-                scale_coeffs[i] = abs(100/(rotated_c[0]+0.000001))
-                rotated_coords[i] = scale(rotated_c,scale_coeffs[i])
-
-            self.rotated_coords = rotated_coords
+
+            #all frames at once -> (frames,4,4)
+            rotation_mtrxs = nget_rotation_mat(self.normed_coords, target_coords)
+            rotated_c = nrotate(self.normed_coords,rotation_mtrxs)
+            scale_coeffs = abs(100/(rotated_c[:,0]+0.000001))
+
+            self.rotated_coords = nscale(rotated_c,scale_coeffs)
             self.rotation_mtrxs = rotation_mtrxs
             self.scale_coeffs = scale_coeffs
 
+            #the whole arm with the hand is rotated together with the shoulder -> (frames,joints,4)
+            descendants = list(j for j in self._get_all_joints()[1:] if hasattr(j,'normed_coords'))
+            if len(descendants)!=0:
+                normed_coords = np.stack(list(j.normed_coords for j in descendants),axis=1)
+                rotated_coords = nscale(nrotate(normed_coords,rotation_mtrxs),scale_coeffs)
+                for k in range(len(descendants)):
+                    descendants[k].rotated_coords = rotated_coords[:,k]
+
             return 
         else:    
 
-            rotated_coords = np.zeros((self.normed_coords.shape[0],3))
             rotation_mtrxs = self._get_root()._get_joint(body_ancestor).rotation_mtrxs
-            #not efficient
-            #rotated_c = nrotate(self.normed_coords,self._get_root()._get_joint(body_ancestor).rotation_mtrxs)
-            #self.rotated_coords =nscale(rotated_c,self._get_root()._get_joint(body_ancestor).scale_coeffs)
-
-            for i in range(self.normed_coords.shape[0]):
-                rotated_c = rotate(self.normed_coords[i],rotation_mtrxs[i])
-                rotated_coords[i] = scale(rotated_c,self._get_root()._get_joint(body_ancestor).scale_coeffs[i])
+            scale_coeffs = self._get_root()._get_joint(body_ancestor).scale_coeffs
 
-            self.rotated_coords = rotated_coords
+            rotated_c = nrotate(self.normed_coords,rotation_mtrxs)
+            self.rotated_coords = nscale(rotated_c,scale_coeffs)
 
             return 
 
     def _get_face_rotated_coords(self):
         #print('Tr ', self.id)
-        self.head_origin_normed= self.normed_coords - self.parent.normed_coords
-        self.head_origin_normed[:,-1] = np.ones(self.head_origin_normed.shape[0])
-
         if self.id==1001:
-            target_coords = np.zeros(self.head_origin_normed.shape)
+            #all face joints at once -> (frames,joints,4)
+            face = self.parent.children
+            normed_coords = np.stack(list(j.normed_coords for j in face),axis=1)
+            head_origin_normed = normed_coords - self.parent.normed_coords[:,None]
+            head_origin_normed[:,:,-1] = 1
+            head_origin_1001 = head_origin_normed[:,face.index(self)]
+            head_origin_1006 = head_origin_normed[:,face.index(self[1006])]
+
+            target_coords = np.zeros(head_origin_1001.shape,dtype=head_origin_1001.dtype)
             target_coords[:,2] = self.dist_to_parent * self._get_root().body_muls
             target_coords[:,-1] = np.ones(target_coords.shape[0])
 
-            rotated_coords = np.zeros((target_coords.shape[0],3))
-            scale_coeffs = np.zeros((target_coords.shape[0]))
-            rotation_mtrxs = np.zeros((target_coords.shape[0],4,4))
+            rotation_mtrxs = nget_face_rotation_mat(head_origin_1001,target_coords,head_origin_1006,np.array([0,-1,0,1]))
+            rotated_c = nrotate(head_origin_1001,rotation_mtrxs)
+            scale_coeffs = abs(150/(rotated_c[:,2]+0.000001))
 
-            face_normed_1006_coords = self[1006].normed_coords - self[1006].parent.normed_coords
-            face_normed_1006_coords[:,-1] = np.ones(self.head_origin_normed.shape[0])
-
-            for i in range(target_coords.shape[0]):
-                rotation_mtrxs[i] = get_face_rotation_mat(self.head_origin_normed[i], target_coords[i],face_normed_1006_coords[i],np.array([0,-1,0,1]))
-                
-                rotated_c = rotate(self.head_origin_normed[i],rotation_mtrxs[i])
-                scale_coeffs[i] = abs(150/(rotated_c[2]+0.000001))
-                rotated_coords[i] = scale(rotated_c,scale_coeffs[i])
+            face_rotated_coords = nscale(nrotate(head_origin_normed,rotation_mtrxs),scale_coeffs)
+            for k in range(len(face)):
+                if self.root.lean==False:
+                    face[k].head_origin_normed = head_origin_normed[:,k]
+                face[k].face_rotated_coords = face_rotated_coords[:,k]
+            del head_origin_normed, face_rotated_coords
 
-            #print(target_coords,rotated_coords,scale_coeffs)
+            #body rotation of the face follows the right shoulder
+            rotated_coords = nscale(nrotate(normed_coords,self[2].rotation_mtrxs),self[2].scale_coeffs)
+            for k in range(len(face)):
+                face[k].rotated_coords = rotated_coords[:,k]
 
-            self.face_rotated_coords = rotated_coords
             self.face_rotation_mtrxs = rotation_mtrxs
             self.face_scale_coeffs = scale_coeffs
 
             return 
         else:    
+            self.head_origin_normed= self.normed_coords - self.parent.normed_coords
+            self.head_origin_normed[:,-1] = np.ones(self.head_origin_normed.shape[0])
 
-            rotated_coords = np.zeros((self.head_origin_normed.shape[0],3))
             rotation_mtrxs = self._get_root()._get_joint(1001).face_rotation_mtrxs
+            scale_coeffs = self._get_root()._get_joint(1001).face_scale_coeffs
 
-            for i in range(self.head_origin_normed.shape[0]):
-                rotated_c = rotate(self.head_origin_normed[i],rotation_mtrxs[i])
-                rotated_coords[i] = scale(rotated_c,self._get_root()._get_joint(1001).face_scale_coeffs[i])
-
-            self.face_rotated_coords = rotated_coords
+            rotated_c = nrotate(self.head_origin_normed,rotation_mtrxs)
+            self.face_rotated_coords = nscale(rotated_c,scale_coeffs)
 
             return 
 
     def _transform_coords(self):
         if self.is_root(): # '1" point as origin
-            self.rotated_coords = np.zeros((self.joint_datum.shape[0],3))
+            self.rotated_coords = np.zeros((self.root.frames,3))
             return
 
         if hasattr(self,'normed_coords'):
@@ -698,12 +1109,11 @@ class Joint_Tree:
             if self.id==2 or self.id==5:
                 self._get_rotated_coords()
             else:
-                if self.is_ancestor(5):
-                    self._get_rotated_coords(5)
-                elif self.is_ancestor(2):
-                    self._get_rotated_coords(2)
+                if self.is_ancestor(5) or self.is_ancestor(2):
+                    #already rotated by the shoulder
+                    pass
                 else:
-                    self.rotated_coords = np.zeros((self.joint_datum.shape[0],3))
+                    self.rotated_coords = np.zeros((self.root.frames,3))
                     self.rotated_coords[:,1] = self.dist_to_parent * self._get_root().body_muls
         
             x_i = self.rotated_coords[:,0]-self.parent.rotated_coords[:,0]
@@ -711,59 +1121,42 @@ class Joint_Tree:
             z_i = self.rotated_coords[:,2]-self.parent.rotated_coords[:,2]
             l_i = (x_i**2 + y_i**2 + z_i**2)**0.5 + 0.000001
             
-            self._alpha = (np.arccos(x_i/l_i))
-            self._beta =  (np.arccos(y_i/l_i))
-            self._gamma = (np.arccos(z_i/l_i))
-
-            if self.level >= 3:    
-                rel_a = np.zeros(self.rotated_coords.shape[0])
-                for i in range(self.rotated_coords.shape[0]):
-                    rel_a[i] = angle_rad((self.rotated_coords[i]-self.parent.rotated_coords[i]),(self.parent.parent.rotated_coords[i]-self.parent.rotated_coords[i]))
-                self.rel_a = rel_a
-                self.relative_color = relative_angle_to_RGB_uint8(self.rel_a)
-
-            self.color = np.vstack((angle_to_uint8(self._alpha),angle_to_uint8(self._beta),angle_to_uint8(self._gamma))).T
+            self._alpha = (np.arccos(np.clip(x_i/l_i,-1,1)))
+            self._beta =  (np.arccos(np.clip(y_i/l_i,-1,1)))
+            self._gamma = (np.arccos(np.clip(z_i/l_i,-1,1)))
+
+            #rel_a of level>=3 joints is computed for the whole tree in _get_relative_angles
+
+            self.color = angle_to_uint8(np.vstack((self._alpha,self._beta,self._gamma)).T)
             self.signal = np.vstack((self._alpha,self._beta,self._gamma)).T
 
         return
 
     def _h_transform_coords(self, body_parent, mediator):
         if hasattr(self,'normed_coords'):
-
-            if self.is_ancestor(2):
-                self._get_rotated_coords(2)
-            elif self.is_ancestor(5):
-                self._get_rotated_coords(5)
+            #hand joints are already rotated by the shoulder
 
             x_i = self.rotated_coords[:,0]-self.parent.rotated_coords[:,0]
             y_i = self.rotated_coords[:,1]-self.parent.rotated_coords[:,1]
             z_i = self.rotated_coords[:,2]-self.parent.rotated_coords[:,2]
             l_i = (x_i**2 + y_i**2 + z_i**2)**0.5 + 0.00001
             
-            self._alpha = (np.arccos(x_i/l_i))
-            self._beta =  (np.arccos(y_i/l_i))
-            self._gamma = (np.arccos(z_i/l_i))
-
-            rel_a = np.zeros(self.rotated_coords.shape[0])
-            special_case = [5,9,13,17]
-            if (self.id-mediator) in special_case:
-                for i in range(self.rotated_coords.shape[0]):
-                    rel_a[i] = angle_rad((self.rotated_coords[i]-self[body_parent].rotated_coords[i]),(self[body_parent].parent.rotated_coords[i]-self[body_parent].rotated_coords[i]))
-            else:
-                for i in range(self.rotated_coords.shape[0]):
-                    rel_a[i] = angle_rad((self.rotated_coords[i]-self.parent.rotated_coords[i]),(self.parent.parent.rotated_coords[i]-self.parent.rotated_coords[i]))
-            self.rel_a = rel_a
-            self.relative_color = relative_angle_to_RGB_uint8(self.rel_a)
+            self._alpha = (np.arccos(np.clip(x_i/l_i,-1,1)))
+            self._beta =  (np.arccos(np.clip(y_i/l_i,-1,1)))
+            self._gamma = (np.arccos(np.clip(z_i/l_i,-1,1)))
+
+            #rel_a is computed for the whole tree in _get_relative_angles
 
-            self.color = np.vstack((angle_to_uint8(self._alpha),angle_to_uint8(self._beta),angle_to_uint8(self._gamma))).T
+            self.color = angle_to_uint8(np.vstack((self._alpha,self._beta,self._gamma)).T)
             self.signal = np.vstack((self._alpha,self._beta,self._gamma)).T
         return
 
     def _f_transform_coords(self):
         #if hasattr(self,'normed_coords'):
         #print('Tr',self.id)
-        self._get_rotated_coords(2)
-        self._get_face_rotated_coords()
+        if self.id==1001:
+            #rotates every face joint, 1001 is the first one of the face
+            self._get_face_rotated_coords()
 
         if self.id!=1001 and self.id!=1006:
 
@@ -773,9 +1166,9 @@ class Joint_Tree:
             z_i = self.face_rotated_coords[:,2] - c[2]
             l_i = (c[0]**2 + c[1]**2 + c[2]**2)**0.5 + 0.000001
 
-            _alpha = (np.arccos(x_i/l_i))
-            _beta =  (np.arccos(y_i/l_i))
-            _gamma = (np.arccos(z_i/l_i))
+            _alpha = (np.arccos(np.clip(x_i/l_i,-1,1)))
+            _beta =  (np.arccos(np.clip(y_i/l_i,-1,1)))
+            _gamma = (np.arccos(np.clip(z_i/l_i,-1,1)))
 
             self._alpha = ((_alpha-(np.pi*0.5))*4) + (np.pi*0.5)
             self._beta = ((_beta -(np.pi*0.5))*4 ) + (np.pi*0.5)
@@ -787,11 +1180,11 @@ class Joint_Tree:
 
             l_i = (x_i**2 + y_i**2 + z_i**2)**0.5 + 0.000001
              
-            self._alpha = (np.arccos(x_i/l_i))
-            self._beta =  (np.arccos(y_i/l_i))
-            self._gamma = (np.arccos(z_i/l_i))
+            self._alpha = (np.arccos(np.clip(x_i/l_i,-1,1)))
+            self._beta =  (np.arccos(np.clip(y_i/l_i,-1,1)))
+            self._gamma = (np.arccos(np.clip(z_i/l_i,-1,1)))
             
-        self.color = np.vstack((angle_to_uint8(self._alpha),angle_to_uint8(self._beta),angle_to_uint8(self._gamma))).T
+        self.color = angle_to_uint8(np.vstack((self._alpha,self._beta,self._gamma)).T)
         self.signal = np.vstack((self._alpha,self._beta,self._gamma)).T
         return
 
@@ -850,7 +1243,7 @@ class Joint_Tree:
         text_color = (0,0,0)#(255,255,255)
         cv2.putText(image,str(text), (30,50), cv2.FONT_HERSHEY_SIMPLEX, 0.6, text_color)
 
-        if add_face:
+        if add_face and self[999] is not None:
             img_face = np.zeros_like(image)
             #img_face.fill(255)
             img_face = self._draw_face(img_face,fr)
@@ -862,11 +1255,11 @@ class Joint_Tree:
     def _draw_joint(self,image,fr,rotated,dot_only=False,print_text=False,dot_radius=2,dot_color=(255,0,0),line_thickness=2,line_color=(0,0,0), font_size=0.4,font_color=(0,0,0)):
         w, h = image.shape[0], image.shape[1]
         if hasattr(self,'color') & rotated:
-            dot_color = self.color[fr]
+            dot_color = tuple(map(int,self.color[fr]))
             line_color = dot_color
             if self.level>=3:
                 if hasattr(self,'relative_color') & rotated:
-                    line_color = self.relative_color[fr] 
+                    line_color = tuple(map(int,self.relative_color[fr]))
 
         if dot_only== False:
             if rotated:
@@ -952,7 +1345,7 @@ class Joint_Tree:
         #print(self.id)
         w, h = image.shape[0], image.shape[1]
         if hasattr(self,'color'):
-            dot_color = self.color[fr]
+            dot_color = tuple(map(int,self.color[fr]))
 
         end_point = tuple(map(int,(np.array([w/2,h/2],dtype=int) + (self.face_rotated_coords[fr][:2]*2.5))))
         try:
@@ -971,94 +1364,47 @@ class Joint_Tree:
             pass
         return image
 
-    def posegram(self, human=False, signal= False):
+    def posegram(self, human=False, signal= False, dtype=None):
+        #dtype: precision of the signal posegram, e.g. np.float16, the precision of the tree by default
         if human:
             #angles in radians converted to uint8 values and RGB combined for each joint -> (rel_joints + joints)x(frames) uint8 RGB
             return self._posegram_human()
         else:
             if signal:
                 #raw angles in radians float values -> (rel_joints + (joints x 3)) x(frames) float binary
-                return self._posegram_machine_signal()
+                gram = self._posegram_machine_signal()
+                return gram if dtype is None else gram.astype(dtype)
             else:
                 #angles in radians converted to uint8 values -> (rel_joints + (joints x 3)) x (frames) uint8 RGB
                 return self._posegram_machine()
 
     def _posegram_machine(self):
-        joints = list(int(k.id) for k in self._get_root())
-        rel_joints =list(int(k.id) for k in self._get_root() if k.level>=3 )
+        sk = self.skeleton
+        color = sk.stage('color')
 
-        img = np.zeros((len(joints),self.color.shape[0],3),dtype=np.uint8)
-
-        i = 0
-        for j in joints:
-            img[i,:] =  self[j].color
-            #print(i,j)
-            i+=1
-
-        r = img[:,:,0]
-        r = r.astype(np.uint8)
-        g = img[:,:,1]
-        g = g.astype(np.uint8)
-        b = img[:,:,2]
-        b = b.astype(np.uint8)
-        img  = np.concatenate((r,g,b),axis=0)
-
-        img_rel = np.zeros((len(rel_joints),self.color.shape[0]),dtype=np.uint8)
-
-        r = 0
-        for j in rel_joints:
-            img_rel[r,:] = angle_to_uint8(self[j].rel_a)
-            r+=1  
-
-        img  = np.concatenate((img_rel,img),axis=0)
+        img = np.zeros((sk.layout.rows,color.shape[0]),dtype=np.uint8)
+        sk.layout.relative(img)[:] = angle_to_uint8(sk.stage('rel_a',sk.rel_joints).T)
+        sk.layout.angles(img)[:] = np.transpose(color,(2,1,0))
 
         return img
 
     def _posegram_machine_signal(self):
-        joints = list(int(k.id) for k in self._get_root())
-        rel_joints =list(int(k.id) for k in self._get_root() if k.level>=3)
-
-        data = np.zeros((len(joints),self.signal.shape[0],3))
-        i = 0
-        for j in joints:
-            data[i,:] = self[j].signal
-            i+=1
-
-        x = data[:,:,0]
-        y = data[:,:,1]
-        z = data[:,:,2]
-        data  = np.concatenate((x,y,z),axis=0)
-
-        data_rel = np.zeros((len(rel_joints),self.signal.shape[0]))
+        sk = self.skeleton
+        signal = sk.stage('signal')
 
-        r = 0
-        for j in rel_joints:
-            data_rel[r,:] = self[j].rel_a
-            r+=1  
+        data = np.zeros((sk.layout.rows,signal.shape[0]),dtype=signal.dtype)
+        sk.layout.relative(data)[:] = sk.stage('rel_a',sk.rel_joints).T
+        sk.layout.angles(data)[:] = np.transpose(signal,(2,1,0))
 
-        data  = np.concatenate((data_rel,data),axis=0)
-
-        return data 
+        return data
 
     def _posegram_human(self):
-        joints = list(int(k.id) for k in self._get_root())
-        rel_joints =list(int(k.id) for k in self._get_root() if k.level>=3 )
-        
-        img = np.zeros((len(joints),self.color.shape[0],3),dtype=np.uint8)
+        sk = self.skeleton
+        color = sk.stage('color')
 
-        i = 0
-        for j in joints:
-            img[i,:] =  self[j].color
-            i+=1
-        
-        img_rel = np.zeros((len(rel_joints),self.color.shape[0],3),dtype=np.uint8)
-
-        r = 0
-        for j in rel_joints:
-            img_rel[r,:] = relative_angle_to_RGB_uint8(self[j].rel_a)
-            r+=1  
-
-        img  = np.concatenate((img_rel,img),axis=0)
+        img = np.zeros((sk.layout.human_rows,color.shape[0],3),dtype=np.uint8)
+        relative_angle_to_RGB_uint8(sk.stage('rel_a',sk.rel_joints).T,out=sk.layout.relative(img))
+        sk.layout.angles(img)[:] = np.transpose(color,(1,0,2))
 
         return img
 
@@ -1076,7 +1422,6 @@ class Joint_Tree:
         data  = np.concatenate((x,y,z),axis=0)
         if to_uint8:
             data = angle_to_uint8(data)
-            data = data.astype(np.uint8)    
         return data 
 
     def _posegram_grayscale_uint8(self):
@@ -1090,33 +1435,94 @@ class Joint_Tree:
 
 #Movement is a wraper for Joint_Tree with extra init functions
 class Movement(Joint_Tree):
-    def __init__(self, movement=None, verbose=True,  holistic = None):
+    _structure = Joint_Tree._structure + ('groups',)
+
+    #cache: True for the default landmark cache, a Landmark_Cache, or False to always run mediapipe on videos.
+    #The settings of a holistic given by the caller are not known, so True does not cache its landmarks,
+    #pass landmark_cache(settings=<its settings>) instead
+    #dtype: precision of the processing, see Joint_Tree
+    #outputs: lean mode, only these posegram forms ('uint8', 'float', 'human') are kept, all the processing arrays are
+    #freed and self.memory reports the bytes used while processing and kept after
+    #profile: True, a Process_Profile or a callback(record) instruments the processing, see self.profile.summary()
+    #groups: joint groups of the tree, see Joint_Tree. Posegrams loaded into it must come from the same groups
+    def __init__(self, movement=None, verbose=True,  holistic = None, cache = True, dtype = np.float64, outputs = None,
+                 profile = None, groups = None):
+        super().__init__(dtype=dtype,groups=groups)
+        self.groups = groups
+        self.grams = None
+        if profile:
+            self.profile = profile if isinstance(profile,Process_Profile) else Process_Profile(None if profile is True else profile)
+        if outputs:
+            self.lean = True
         if type(movement) == type('path'):
-            super().__init__()
             if movement.find('.joblib')!=-1:
                 mov = joblib.load(movement)
             elif movement.find('.mp4')!=-1 or movement.find('.MOV')!=-1 or movement.find('.MP4')!=-1 or movement.find('.mov')!=-1:
-                mov = self.movement_from_mediapipe(movement,verbose,holistic)
+                if cache is True:
+                    cache = landmark_cache(settings=holistic_settings(groups)) if holistic is None else None
+                if cache:
+                    mov = cache.get_or_extract(movement,lambda: self.movement_from_mediapipe(movement,verbose,holistic))
+                    self.fps = mov['Meta']['FPS']
+                else:
+                    mov = self.movement_from_mediapipe(movement,verbose,holistic)
             self.process(mov)
+            del mov
         elif type(movement) == type({}):
-            super().__init__()
             self.process(movement)
-        elif type(movement) == type(np.array([])):
-            super().__init__()
-            if type(abs(movement.item(0))) ==type(int(0)):
-                self.from_gram_process(movement)
-            if type(abs(movement.item(0))) ==type(float(0)):
-                self.from_gram_process(signal_to_uint(np.absolute(movement)))
-        else:
-            super().__init__()
-
-    def movement_from_mediapipe(self, video_path, verbose = True, holistic = None):
-        def process_frame_with_mp(holistic,in_frame):
-            in_frame.flags.writeable = False
-            results = holistic.process(in_frame)
-            in_frame.flags.writeable = True
-            return results
-
+        elif isinstance(movement,np.ndarray):
+            self.load_posegram(movement)
+        if outputs and movement is not None:
+            self._keep_outputs(outputs)
+
+    def reset(self):
+        super().reset()
+        self.grams = None
+
+    def load_posegram(self, gram):
+        #uint8, float (signal) or human posegram, the tree can be loaded again with the next posegram
+        if self.profile is None:
+            return self._load_posegram(gram)
+        self.profile.begin(gram.shape[1])
+        try:
+            mark = self.profile.start()
+            self._load_posegram(gram)
+            self.profile.stop(mark,'decode',None,gram.shape[1])
+        finally:
+            self.profile.end()
+
+    def _load_posegram(self, gram):
+        if type(abs(gram.item(0))) ==type(int(0)):
+            self.from_gram_process(gram)
+        if type(abs(gram.item(0))) ==type(float(0)):
+            self.from_gram_process(signal_to_uint(np.absolute(gram)))
+
+    def _keep_outputs(self, outputs):
+        grams = dict((form,self.posegram(human=(form=='human'),signal=(form=='float'))) for form in outputs)
+        processing = self.memory_usage()
+        self.free_arrays()
+        self.grams = grams
+        self.memory = {'processing':sum(processing.values()),
+                       'kept':sum(g.nbytes for g in grams.values())}
+
+    def posegram(self, human=False, signal= False, dtype=None):
+        if getattr(self,'grams',None) is None:
+            if self.profile is None:
+                return super().posegram(human,signal,dtype)
+            self.profile.begin()
+            try:
+                mark = self.profile.start()
+                gram = super().posegram(human,signal,dtype)
+                self.profile.stop(mark,'encode',None,gram.shape[1])
+            finally:
+                self.profile.end()
+            return gram
+        form = 'human' if human else ('float' if signal else 'uint8')
+        if form not in self.grams:
+            raise ValueError('This lean Movement keeps only the %s posegram' % ', '.join(self.grams))
+        gram = self.grams[form]
+        return gram if dtype is None or form!='float' else gram.astype(dtype)
+
+    def movement_from_mediapipe(self, video_path, verbose = True, holistic = None, queue_depth = PIPELINE_QUEUE_DEPTH):
         mov_dict = {}
         cap = cv2.VideoCapture(video_path)
         if (cap.isOpened()== False): 
@@ -1135,54 +1541,16 @@ class Movement(Joint_Tree):
         MP_Pose = np.zeros((frames_total,33,7))
         MP_RHand = np.zeros((frames_total,21,4))
         MP_LHand = np.zeros((frames_total,21,4))
-        fr = 0
+        buffers = {'MP_Pose':MP_Pose,
+                   'MP_Face':MP_Face,
+                   'MP_RHand':MP_RHand,
+                   'MP_LHand':MP_LHand}
         if holistic:
-            while(cap.isOpened()):
-                ret, frame = cap.read()
-                if ret == True:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    new_result  = process_frame_with_mp(holistic,frame)
-                    if new_result:
-                        if new_result.face_landmarks:
-                            MP_Face[fr] = mp_frame_coords(new_result.face_landmarks,frame_height,frame_width)
-                        if new_result.pose_landmarks:
-                            MP_Pose[fr] = mp_frame_coords(new_result.pose_landmarks,frame_height,frame_width,new_result.pose_world_landmarks)
-                        if new_result.right_hand_landmarks:
-                            MP_RHand[fr] = mp_frame_coords(new_result.right_hand_landmarks,frame_height,frame_width)
-                        if new_result.left_hand_landmarks:
-                            MP_LHand[fr] = mp_frame_coords(new_result.left_hand_landmarks,frame_height,frame_width)
-                    fr+=1
-                    if ((fr/frames_total)*100)%10==0 and verbose:
-                        print('Progress ',(int((fr/frames_total)*100)), "%",end='\r')
-                else: 
-                    break
+            mediapipe_pipeline(cap,holistic,buffers,frame_height,frame_width,verbose,queue_depth)
         else:
             mp_holistic = mp.solutions.holistic
-            with mp_holistic.Holistic(
-                smooth_landmarks=True,
-                model_complexity=2,
-                min_detection_confidence=0.1,
-                refine_face_landmarks=True,
-                min_tracking_confidence=0.1) as holistic:
-                while(cap.isOpened()):
-                    ret, frame = cap.read()
-                    if ret == True:
-                        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        new_result  = process_frame_with_mp(holistic,frame)
-                        if new_result:
-                            if new_result.face_landmarks:
-                                MP_Face[fr] = mp_frame_coords(new_result.face_landmarks,frame_height,frame_width)
-                            if new_result.pose_landmarks:
-                                MP_Pose[fr] = mp_frame_coords(new_result.pose_landmarks,frame_height,frame_width,new_result.pose_world_landmarks)
-                            if new_result.right_hand_landmarks:
-                                MP_RHand[fr] = mp_frame_coords(new_result.right_hand_landmarks,frame_height,frame_width)
-                            if new_result.left_hand_landmarks:
-                                MP_LHand[fr] = mp_frame_coords(new_result.left_hand_landmarks,frame_height,frame_width)
-                        fr+=1
-                        if ((fr/frames_total)*100)%10==0 and verbose:
-                            print('Progress ',(int((fr/frames_total)*100)), "%",end='\r')
-                    else: 
-                        break
+            with mp_holistic.Holistic(**holistic_settings(getattr(self,'groups',None))) as holistic:
+                mediapipe_pipeline(cap,holistic,buffers,frame_height,frame_width,verbose,queue_depth)
                 del(mp_holistic)
             #holistic.__exit__()
 
@@ -1199,180 +1567,451 @@ class Movement(Joint_Tree):
                             'W':frame_width,
                             'FPS':fps,
                             'Frames':frames_total}
-        out_name_i = video_path.rfind('.')
-        #print(video_path[:out_name_i]+'.joblib')
-        #joblib.dump(mov_dict,video_path[:out_name_i]+'.joblib')
         del(cap,MP_Pose,MP_Face,MP_LHand,MP_RHand)
         return mov_dict
 
     def from_gram_process(self,gram): 
-        def get_face_rotation_from_rel(inp_x,inp_1,tar_1,inp_6,tar_6):
-            i_x = np.ones(4)
-            i_x[:3] = inp_x
-            i_1 = np.ones(4)
-            i_1[:3] = inp_1
-            i_6 = np.ones(4)
-            i_6[:3] = inp_6
-            i_t1 = np.ones(4)
-            i_t1[:3] = tar_1
-            i_t6 = np.ones(4)
-            i_t6[:3] = tar_6
-
-            rot_mat = get_face_rotation_mat(i_1,i_t1,i_6,i_t6)
-            rotated_c = rotate(i_x,rot_mat)
-            scale_coeff = abs((np.linalg.norm(tar_1))/(np.linalg.norm(inp_1)+0.000001))
-            rotated_coords = scale(rotated_c,scale_coeff)
-            return rotated_coords[:3]
-
-        joints = list(k for k in self)
-        rel_joints =list(int(k.id) for k in self if k.level>=3 )
-        r = len(rel_joints)
-        
-        if len(gram.shape)==3: #from human            
-            gram = np.transpose(gram[44:,:,:],(2,0,1))
-            gram = gram.reshape((gram.shape[0]*gram.shape[1],gram.shape[2]))
-
-        if gram.shape[0]==411:
-            r = 0 
-        print(gram.shape)
+        #all the joints and frames at once: the body and the face anchors 1001/1006 level by level from their parents,
+        #the other face joints with one face rotation per frame
+        sk = self.skeleton
+        joints = list(self.joints_index.values())
         jn = len(joints)
-        for i in range(len(joints)):
-            j = joints[i]
-            _alpha = np.zeros((gram.shape[1]))
-            _beta = np.zeros((gram.shape[1]))
-            _gamma = np.zeros((gram.shape[1]))
-            
-            rotated_coords = np.zeros((gram.shape[1],3))
-            if j.id!=1:
-                if j.id>999:
-                    face_rotated_coords = np.zeros((gram.shape[1],3))
-                    c = j._get_root().relaxed_face[str(j.id)][0]
-                    if j.id!=1001 and j.id!=1006:
-                        _alpha = uint8_to_angle(gram[r+i,:])
-                        _beta  = uint8_to_angle(gram[r+jn+i,:])
-                        _gamma = uint8_to_angle(gram[r+(jn*2)+i,:])
-
-                        _alpha = ((_alpha - (np.pi*0.5))/4) +(np.pi*0.5) 
-                        _beta  = ((_beta - (np.pi*0.5))/4) +(np.pi*0.5)
-                        _gamma = ((_gamma - (np.pi*0.5))/4) +(np.pi*0.5)
-
-                        l_i = (c[0]**2 + c[1]**2 + c[2]**2)**0.5 + 0.000001
-
-                        x_i = np.cos(_alpha)*l_i
-                        y_i = np.cos(_beta)*l_i
-                        z_i = np.cos(_gamma)*l_i
-                        
-                        face_rotated_coords[:,0] = c[0] + x_i
-                        face_rotated_coords[:,1] = c[1] + y_i
-                        face_rotated_coords[:,2] = c[2] + z_i
-                    else:
-                        face_rotated_coords[:] = c
-                    j.face_rotated_coords = face_rotated_coords
-
-                
-                if j.id>999 and j.id!=1001 and j.id!=1006:
-                    for fr in range(rotated_coords.shape[0]):
-                        head_origin_1 = self[1001].rotated_coords[fr] - self[1001].parent.rotated_coords[fr]
-                        head_origin_6 = self[1006].rotated_coords[fr] - self[1006].parent.rotated_coords[fr]
-                        
-                        rotated_c = get_face_rotation_from_rel(face_rotated_coords[fr],
-                                                                self[1001].face_rotated_coords[fr],
-                                                                head_origin_1,
-                                                                self[1006].face_rotated_coords[fr],
-                                                                head_origin_6)
-                        rotated_coords[fr] = j.parent.rotated_coords[fr] + rotated_c
-                else:
-                    _alpha = uint8_to_angle(gram[r+i,:])
-                    _beta  = uint8_to_angle(gram[r+jn+i,:])
-                    _gamma = uint8_to_angle(gram[r+(jn*2)+i,:])
-                    
-                    l_i = j.dist_to_parent * 200
-                    x_i = np.cos(_alpha)*l_i
-                    y_i = np.cos(_beta)*l_i
-                    z_i = np.cos(_gamma)*l_i
-                    
-                    rotated_coords[:,0] = j.parent.rotated_coords[:,0] + x_i
-                    rotated_coords[:,1] = j.parent.rotated_coords[:,1] + y_i
-                    rotated_coords[:,2] = j.parent.rotated_coords[:,2] + z_i
-
-            j.rotated_coords = rotated_coords
-
-            ##RECREATING THE SIGNAL AND COLOR CODING
-            if j.dist_to_parent!=0:
-
-                if j.id>999 and j.id!=1001 and j.id!=1006:
-                    c =   j._get_root().relaxed_face[str(j.id)][0]
-
-                    x_i = j.face_rotated_coords[:,0] - c[0]
-                    y_i = j.face_rotated_coords[:,1] - c[1]
-                    z_i = j.face_rotated_coords[:,2] - c[2]
-                    l_i = (c[0]**2 + c[1]**2 + c[2]**2)**0.5 + 0.000001
-
-                    _alpha = (np.arccos(x_i/l_i))
-                    _beta =  (np.arccos(y_i/l_i))
-                    _gamma = (np.arccos(z_i/l_i))
-
-                    _alpha = ((_alpha-(np.pi*0.5))*4) + (np.pi*0.5)
-                    _beta = ((_beta -(np.pi*0.5))*4 ) + (np.pi*0.5)
-                    _gamma = ((_gamma-(np.pi*0.5))*4 ) + (np.pi*0.5)
-
-                else:
-                    #print(j.id)
-                    x_i = j.rotated_coords[:,0]-j.parent.rotated_coords[:,0]
-                    y_i = j.rotated_coords[:,1]-j.parent.rotated_coords[:,1]
-                    z_i = j.rotated_coords[:,2]-j.parent.rotated_coords[:,2]
-                    l_i = (x_i**2 + y_i**2 + z_i**2)**0.5 + 0.000001
-                    
-                    _alpha = (np.arccos(x_i/l_i))
-                    _beta =  (np.arccos(y_i/l_i))
-                    _gamma = (np.arccos(z_i/l_i))
+        frames = gram.shape[1]
+        self.frames = frames
 
-            j._alpha = _alpha
-            j._beta = _beta
-            j._gamma = _gamma
-
-
-            if j.level >= 3:
-                rel_a = np.zeros(j.rotated_coords.shape[0])
-                special_case_7 = [705,709,713,717]
-                special_case_4 = [405,409,413,417]
-                if j.id in special_case_7:
-                    for i in range(j.rotated_coords.shape[0]):
-                        rel_a[i] = angle_rad((j.rotated_coords[i]-j[7].rotated_coords[i]),(j[7].parent.rotated_coords[i]-j[7].rotated_coords[i]))
-                elif j.id in special_case_4:
-                    for i in range(j.rotated_coords.shape[0]):
-                        rel_a[i] = angle_rad((j.rotated_coords[i]-j[4].rotated_coords[i]),(j[4].parent.rotated_coords[i]-j[4].rotated_coords[i]))
-                else:
-                    for i in range(j.rotated_coords.shape[0]):
-                        rel_a[i] = angle_rad((j.rotated_coords[i]-j.parent.rotated_coords[i]),(j.parent.parent.rotated_coords[i]-j.parent.rotated_coords[i]))
-                j.rel_a = rel_a
-                j.relative_color = relative_angle_to_RGB_uint8(j.rel_a)
-
-            j.color = np.vstack((angle_to_uint8(j._alpha),angle_to_uint8(j._beta),angle_to_uint8(j._gamma))).T    
-            j.signal = np.vstack((j._alpha,j._beta,j._gamma)).T
+        #(frames,joints,3) alpha, beta, gamma of every joint
+        if gram.ndim==3: #from human
+            angles = np.transpose(uint8_to_angle(sk.layout.angles(gram)),(1,0,2))
+        else:
+            angles = np.transpose(uint8_to_angle(sk.layout.angles(gram)),(2,1,0))
+
+        ids = sk.ids
+        parents = sk.parent_index
+        face = np.flatnonzero(ids>999)
+        anchors = np.flatnonzero((ids==1001)|(ids==1006))
+        face_rel = np.flatnonzero((ids>999)&(ids!=1001)&(ids!=1006))
+        body = np.flatnonzero((ids!=1)&((ids<=999)|(ids==1001)|(ids==1006)))
+        dist = sk.dist_to_parent
+        #trees without the face group
+        has_face = len(face)>0
+
+        #relaxed face coords of the face joints
+        c = np.array(list(self.relaxed_face[str(int(ids[k]))][0][:3] for k in face),dtype=float)
+        c_index = dict((k,n) for n,k in enumerate(face))
+        if has_face:
+            c_rel = c[[c_index[k] for k in face_rel]]
+            l_rel = np.linalg.norm(c_rel,axis=1) + 0.000001
+
+            face_rotated_coords = np.broadcast_to(c,(frames,)+c.shape).copy()
+            face_angles = ((angles[:,face_rel] - (np.pi*0.5))/4) +(np.pi*0.5)
+            face_rotated_coords[:,[c_index[k] for k in face_rel]] = c_rel + np.cos(face_angles)*l_rel[:,None]
+
+        rotated_coords = np.zeros((frames,jn,3))
+        offsets = np.cos(angles)*(dist*200)[:,None]
+        for level in range(1,sk.levels.max()+1):
+            ks = body[sk.levels[body]==level]
+            rotated_coords[:,ks] = rotated_coords[:,parents[ks]] + offsets[:,ks]
+
+        if has_face:
+            #face rotation of every frame, from the relaxed face anchors to the decoded ones
+            i_1 = np.ones((frames,4))
+            i_1[:,:3] = c[c_index[anchors[0]]]
+            i_6 = np.ones((frames,4))
+            i_6[:,:3] = c[c_index[anchors[1]]]
+            i_t1 = np.ones((frames,4))
+            i_t1[:,:3] = rotated_coords[:,anchors[0]] - rotated_coords[:,parents[anchors[0]]]
+            i_t6 = np.ones((frames,4))
+            i_t6[:,:3] = rotated_coords[:,anchors[1]] - rotated_coords[:,parents[anchors[1]]]
+            rot_mat = nget_face_rotation_mat(i_1,i_t1,i_6,i_t6)
+            scale_coeffs = abs((np.linalg.norm(i_t1[:,:3],axis=1))/(np.linalg.norm(i_1[:,:3],axis=1)+0.000001))
+
+            i_x = np.ones((frames,len(face_rel),4))
+            i_x[:,:,:3] = face_rotated_coords[:,[c_index[k] for k in face_rel]]
+            rotated_coords[:,face_rel] = rotated_coords[:,parents[face_rel]] + nscale(nrotate(i_x,rot_mat),scale_coeffs)
+
+        ##RECREATING THE SIGNAL AND COLOR CODING
+        #joints on their parent (the wrists 400, 700) keep the decoded angles, the root stays 0
+        signal = np.where(((dist==0)&(ids!=1))[:,None],angles,0)
+        moving = np.flatnonzero(dist!=0)
+        d = rotated_coords[:,moving] - rotated_coords[:,parents[moving]]
+        l_i = np.linalg.norm(d,axis=2,keepdims=True) + 0.000001
+        signal[:,moving] = np.arccos(np.clip(d/l_i,-1,1))
+
+        if has_face:
+            d = face_rotated_coords[:,[c_index[k] for k in face_rel]] - c_rel
+            face_signal = np.arccos(np.clip(d/l_rel[:,None],-1,1))
+            signal[:,face_rel] = ((face_signal-(np.pi*0.5))*4) + (np.pi*0.5)
+
+        sk.set_joints('rotated_coords',np.arange(jn),rotated_coords)
+        if has_face:
+            sk.set_joints('face_rotated_coords',face,face_rotated_coords)
+        sk.set_joints('signal',np.arange(jn),signal)
+        sk.set_joints('color',np.arange(jn),angle_to_uint8(signal))
+        signal = sk.stage('signal')
+        for k in range(jn):
+            joints[k]._alpha = signal[:,k,0]
+            joints[k]._beta = signal[:,k,1]
+            joints[k]._gamma = signal[:,k,2]
+        self._get_relative_angles()
         return
 
-    def make_a_video(self, out_path, fps = 60):
-        X_DIMENSION = 600
-        Y_DIMENSION = 600
+    def make_a_video(self, out_path, fps = 60, size = 600, workers = None):
+        #frames drawn as _draw_tree(image,fr,True,[],add_face=True), by render_video in worker processes
         if hasattr(self,'fps'):
             fps = self.fps
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        out = cv2.VideoWriter(out_path, fourcc, fps, (X_DIMENSION, Y_DIMENSION))
-        total = self.rotated_coords.shape[0]
+        return render_video(self,out_path,fps,size,workers=workers)
+
+#Movement_Stream takes the frames one at a time (live capture) and emits posegram columns as they become ready.
+#The last `window` frames are kept in ring buffers and processed together, so every frame costs the same and the
+#memory stays bounded. The column of a frame is emitted `lag` frames later: with lag >= 2 the smoothing window is
+#complete and the column equals the one of the offline posegram, except around face dropouts. The missing face is
+#interpolated from the frames in the window only, so columns emitted while the face is missing in the newest frame
+#(a gap running past frame+lag) or in the oldest frame of the window can differ from the offline ones.
+#lag=0 emits the newest frame at once with the smoothing padded at the right edge like at the end of a clip.
+#Until a face is seen the body size is the default one, as for a single frame without a face.
+class Movement_Stream(Movement):
+    _structure = Movement._structure + ('window','lag','gram_format','ring')
+
+    def __init__(self, window=STREAM_WINDOW, lag=STREAM_LAG, human=False, signal=False, face_landmarks=478, dtype=np.float64,
+                 groups=None):
+        super().__init__(dtype=dtype,groups=groups)
+        if window < 2*lag+1:
+            raise ValueError('window must be at least 2*lag+1 frames')
+        self.window = window
+        self.lag = lag
+        #signal is a joint stage, the posegram arguments are kept together
+        self.gram_format = (human,signal)
+        self.ring = {'MP_Pose':np.zeros((window,33,7)),
+                     'MP_Face':np.zeros((window,face_landmarks,4)),
+                     'MP_RHand':np.zeros((window,21,4)),
+                     'MP_LHand':np.zeros((window,21,4))}
+        self.reset()
+
+    def reset(self):
+        #starts a new stream, the window and the posegram format are kept
+        super().reset()
+        for buffer in self.ring.values():
+            buffer.fill(0)
+        self.frames_pushed = 0
+        #window index of the last emitted frame in the processed joint arrays, for drawing it
+        self.ready_index = None
+
+    def push_frame(self, results, H, W):
+        #holistic results of the next frame -> posegram column of frame frames_pushed-1-lag, or None when none is ready.
+        #Frames without a pose are dropped
+        if results is None or not results.pose_landmarks:
+            return None
+        slot = self.frames_pushed % self.window
+        for buffer in self.ring.values():
+            buffer[slot].fill(0)
+        mp_results_coords(results,H,W,self.ring,slot)
+        return self._push()
+
+    def push_coords(self, frame):
+        #same as push_frame for already converted landmarks: {'MP_Pose':(33,7),'MP_Face':(478,4),...} of one frame
+        slot = self.frames_pushed % self.window
+        for key, buffer in self.ring.items():
+            buffer[slot] = frame[key]
+        return self._push()
+
+    def flush(self):
+        #columns of the last lag frames at the end of the stream -> (rows,lag) posegram
+        n = min(self.frames_pushed,self.window)
+        if self.lag==0 or n==0 or self.ready_index is None:
+            return None
+        self.ready_index = n-1
+        return self._gram()[:,n-min(self.lag,n):]
+
+    def _push(self):
+        self.frames_pushed += 1
+        n = min(self.frames_pushed,self.window)
+        if self.frames_pushed-1 < self.lag:
+            return None
+        #oldest to newest
+        start = self.frames_pushed % self.window if self.frames_pushed > self.window else 0
+        order = (np.arange(n)+start) % self.window
+        sign_mov = dict((key,buffer[order]) for key, buffer in self.ring.items())
+        if np.any(sign_mov['MP_Face']):
+            self.process(sign_mov)
+        else:
+            #no face in the whole window, the body size of the last window is kept, the default one before any face
+            self.process(sign_mov,b_mul=self.body_muls[-1] if hasattr(self,'body_muls') else 98.0)
+        self.ready_index = n-1-self.lag
+        return self._gram()[:,self.ready_index]
+
+    def _gram(self):
+        return self.posegram(*self.gram_format)
+
+#Movement_Batch processes many clips as one: the landmark dicts are concatenated along the frames and go through the
+#tree once, self.clip_offsets (clips+1,) is the first frame of every clip. Smoothing, zero interpolation and the body
+#size are computed clip by clip, nothing crosses the clip boundaries, so every clip gets the posegram of Movement(clip).
+class Movement_Batch(Movement):
+    #the clip boundaries are kept by reset() and free_arrays(), the batch can be processed again
+    _structure = Movement._structure + ('clip_offsets','metas')
+
+    #movements: landmark dicts and/or .joblib paths, missing or empty landmark arrays are taken as zeros
+    def __init__(self, movements, dtype=np.float64, outputs=None, profile=None, groups=None):
+        super().__init__(dtype=dtype,outputs=outputs,profile=profile,groups=groups)
+        movs = list(joblib.load(m) if isinstance(m,str) else m for m in movements)
+        if len(movs)==0:
+            raise ValueError('Movement_Batch needs at least one clip')
+        self.metas = list(m.get('Meta') for m in movs)
+        self.clip_offsets = np.concatenate(([0],np.cumsum(list(len(m['MP_Pose']) for m in movs)))).astype(int)
+
+        batch = {}
+        for key, shape in (('MP_Pose',(33,7)),('MP_Face',(478,4)),('MP_RHand',(21,4)),('MP_LHand',(21,4))):
+            arrays = list(np.asarray(m.get(key,())) for m in movs)
+            if key=='MP_Face':
+                #468 or 478 face landmarks
+                shape = (max(list(a.shape[1] for a in arrays if a.ndim==3) or [shape[0]]),shape[1])
+            batch[key] = np.zeros((self.clip_offsets[-1],)+shape,dtype=self.skeleton.dtype)
+            for a, start, stop in zip(arrays,self.clip_offsets[:-1],self.clip_offsets[1:]):
+                if a.ndim==3:
+                    batch[key][start:stop,:a.shape[1],:a.shape[2]] = a
+        self.process(batch)
+        del batch
+        if outputs:
+            self._keep_outputs(outputs)
+
+    @property
+    def clips(self):
+        return len(self.clip_offsets)-1
+
+    def clip_slice(self, k):
+        return slice(int(self.clip_offsets[k]),int(self.clip_offsets[k+1]))
+
+    def posegrams(self, human=False, signal=False, dtype=None):
+        #posegram of every clip, views into the posegram of the batch
+        gram = self.posegram(human,signal,dtype)
+        return list(gram[:,self.clip_slice(k)] for k in range(self.clips))
+
+    def padded_posegrams(self, human=False, signal=False, dtype=None, fill=0):
+        #(clips,rows,longest clip[,3]) posegrams padded with fill after the end of every clip, and the clip lengths
+        gram = self.posegram(human,signal,dtype)
+        lengths = np.diff(self.clip_offsets)
+        padded = np.full((self.clips,gram.shape[0],lengths.max())+gram.shape[2:],fill,dtype=gram.dtype)
+        for k in range(self.clips):
+            padded[k,:,:lengths[k]] = gram[:,self.clip_slice(k)]
+        return padded, lengths
 
-        for fr in range(total):
+### FUNCTIONS ###
 
-            black_image = np.zeros((X_DIMENSION, Y_DIMENSION,3),dtype=np.uint8)
-            black_image = self._draw_tree(black_image,fr,True,[],add_face=True)
-            black_image = cv2.cvtColor(black_image.astype(np.uint8),cv2.COLOR_BGR2RGB)
-            out.write(black_image)
+def mediapipe_pipeline(cap, holistic, buffers, H, W, verbose=True, queue_depth=PIPELINE_QUEUE_DEPTH):
+    #video decoding thread -> holistic inference (in the calling thread) -> landmark packing thread,
+    #with bounded queues of queue_depth frames in between; queue_depth=0 runs the stages one after another
+    frames_total = buffers['MP_Pose'].shape[0]
 
-            #if ((fr/total)*100)%10==0:
-            #    print('Progress ',(int((fr/total)*100)), "%")
-        out.release()
+    def decode():
+        ret, frame = cap.read()
+        if ret == True:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
-### FUNCTIONS ###
+    def infer(frame):
+        frame.flags.writeable = False
+        return holistic.process(frame)
+
+    def pack(fr, new_result):
+        if new_result:
+            mp_results_coords(new_result,H,W,buffers,fr)
+        if (((fr+1)/frames_total)*100)%10==0 and verbose:
+            print('Progress ',(int(((fr+1)/frames_total)*100)), "%",end='\r')
+
+    if queue_depth==0:
+        fr = 0
+        while(cap.isOpened()):
+            frame = decode()
+            if frame is None:
+                break
+            pack(fr,infer(frame))
+            fr+=1
+        return fr
+
+    decoded = queue.Queue(queue_depth)
+    inferred = queue.Queue(queue_depth)
+    stop = threading.Event()
+    errors = []
+    packed = [0]
+
+    def put(q, item):
+        #gives up once the pipeline is stopped, so a failed stage never leaves a thread blocked
+        while stop.is_set()==False:
+            try:
+                q.put(item,timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def decoder():
+        try:
+            while(cap.isOpened()):
+                frame = decode()
+                if frame is None or put(decoded,frame)==False:
+                    break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(decoded,None)
+
+    def packer():
+        #keeps draining the queue after an error, inference is never blocked by it
+        while True:
+            new_result = inferred.get()
+            if new_result is None:
+                break
+            if len(errors)==0:
+                try:
+                    pack(packed[0],new_result)
+                    packed[0]+=1
+                except Exception as e:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=decoder,daemon=True),threading.Thread(target=packer,daemon=True)]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            frame = decoded.get()
+            if frame is None:
+                break
+            inferred.put(infer(frame))
+    finally:
+        stop.set()
+        inferred.put(None)
+        for t in threads:
+            t.join()
+    if len(errors)!=0:
+        raise errors[0]
+    return packed[0]
+
+def precision_report(movement, dtype=np.float32, signal_dtype=np.float16):
+    #processes a landmark dict in float64 and in dtype, and compares the posegrams:
+    #the maximum angular error of the signal posegram in dtype and emitted as signal_dtype,
+    #the uint8 posegram cells that differ, and the memory of the stages
+    ref = Movement(movement,verbose=False)
+    low = Movement(movement,verbose=False,dtype=dtype)
+    ref_signal = ref.posegram(signal=True)
+    report = {'dtype':np.dtype(dtype).name,
+              'signal_dtype':np.dtype(signal_dtype).name,
+              'frames':ref_signal.shape[1]}
+    for name, gram in (('signal',low.posegram(signal=True)),('emitted',low.posegram(signal=True,dtype=signal_dtype))):
+        err = np.abs(gram.astype(np.float64)-ref_signal)
+        report['max_angle_error_rad_'+name] = float(np.nanmax(err)) if np.any(np.isfinite(err)) else 0.0
+        report['nan_mismatch_'+name] = int(np.sum(np.isnan(gram)!=np.isnan(ref_signal)))
+    report['max_angle_error_deg'] = float(np.rad2deg(max(report['max_angle_error_rad_signal'],report['max_angle_error_rad_emitted'])))
+    uint8_diff = np.abs(low.posegram().astype(int)-ref.posegram().astype(int))
+    report['uint8_cells_changed'] = int(np.sum(uint8_diff!=0))
+    report['uint8_max_diff'] = int(uint8_diff.max())
+    report['bytes_float64'] = int(ref.skeleton.nbytes())
+    report['bytes_'+report['dtype']] = int(low.skeleton.nbytes())
+    return report
+
+def mp_results_coords(results, H, W, buffers, fr):
+    #writes one holistic result into frame fr of the MP_* buffers, missing parts are left untouched
+    if results.face_landmarks:
+        mp_frame_coords(results.face_landmarks,H,W,out=buffers['MP_Face'][fr])
+    if results.pose_landmarks:
+        mp_frame_coords(results.pose_landmarks,H,W,results.pose_world_landmarks,out=buffers['MP_Pose'][fr])
+    if results.right_hand_landmarks:
+        mp_frame_coords(results.right_hand_landmarks,H,W,out=buffers['MP_RHand'][fr])
+    if results.left_hand_landmarks:
+        mp_frame_coords(results.left_hand_landmarks,H,W,out=buffers['MP_LHand'][fr])
+
+def holistic_settings(groups=None):
+    #without the face group the face mesh is run without the iris refinement (468 landmarks),
+    #the face landmarks are still needed for the body size
+    if groups is None or 'face' in groups:
+        return HOLISTIC_SETTINGS
+    return dict(HOLISTIC_SETTINGS,refine_face_landmarks=False)
+
+def holistic_settings_variants():
+    #the settings of holistic_settings(groups) for every joint group selection
+    return [holistic_settings(), holistic_settings(['body'])]
+
+def landmark_cache(cache_dir=LANDMARK_CACHE_DIR, max_size=LANDMARK_CACHE_SIZE, settings=None):
+    #landmarks depend on the Holistic settings and on the models of the installed mediapipe version
+    if settings is None:
+        settings = HOLISTIC_SETTINGS
+    settings = dict(settings,mediapipe=getattr(mp,'__version__',''))
+    return Landmark_Cache(settings,cache_dir,max_size)
+
+def relative_angle_index(joints, index):
+    #for every level>=3 joint the angle is taken at the vertex joint (parent) between the joint and the end (grandparent),
+    #the finger bases 5,9,13,17 of a hand take the wrist (4 or 7) as the vertex
+    rel_joints, rel_vertex, rel_end = [], [], []
+    for j in joints:
+        if j.level >= 3:
+            vertex = j.parent
+            if (400 < j.id < 500 or 700 < j.id < 800) and (j.id%100) in [5,9,13,17]:
+                vertex = joints[index[j.id//100]]
+            rel_joints.append(index[j.id])
+            rel_vertex.append(index[vertex.id])
+            rel_end.append(index[vertex.parent.id])
+    return np.array(rel_joints,dtype=int), np.array(rel_vertex,dtype=int), np.array(rel_end,dtype=int)
+
+def get_relaxed_face():
+    #loaded once per process, shared by all the trees and never modified
+    if 'model' not in _RELAXED_FACE:
+        _RELAXED_FACE['model'] = joblib.load(RELAXED_FACE_MODEL)
+    return _RELAXED_FACE['model']
+
+def body_dict_key(Body_Dict):
+    #hashable content of a Body_Dict, equal dicts share their cached trees.
+    #The dicts of the module (COCO_BODY_TREE, the group selections) are never freed, their keys are looked up by identity
+    known = _BODY_DICT_KEYS.get(id(Body_Dict))
+    if known is not None and known[0] is Body_Dict:
+        return known[1]
+    return tuple(sorted((str(k),tuple(int(c) for c in v[0]),float(v[1])) for k, v in Body_Dict.items()))
+
+def _keep_body_dict_key(Body_Dict):
+    _BODY_DICT_KEYS[id(Body_Dict)] = (Body_Dict,body_dict_key(Body_Dict))
+
+_keep_body_dict_key(COCO_BODY_TREE)
+
+def skeleton_template(Body_Dict=COCO_BODY_TREE, root_id=1):
+    #prebuilt tree for a Body_Dict, new trees are cloned from it; one per distinct Body_Dict content
+    key = (body_dict_key(Body_Dict),root_id)
+    if key not in _SKELETON_TEMPLATES:
+        template = Joint_Tree.__new__(Joint_Tree)
+        template._build(Body_Dict,root_id,None)
+        _SKELETON_TEMPLATES[key] = template
+    return _SKELETON_TEMPLATES[key]
+
+def posegram_layout(Body_Dict=COCO_BODY_TREE, root_id=1, groups=None):
+    #Posegram_Layout of the trees of a Body_Dict, built once with the tree template
+    return skeleton_template(select_joint_groups(Body_Dict,groups),root_id).skeleton.layout
+
+def posegram_joint_groups(gram, Body_Dict=COCO_BODY_TREE, root_id=1):
+    #joint groups of a posegram from its rows, None for the whole tree. One hand with or without the face has the rows
+    #of the other hand, such posegrams raise ValueError and need their groups from where they were made
+    selections = [None]+list(['body']+list(extra) for n in (2,1,0) for extra in itertools.combinations(JOINT_GROUPS[1:],n))
+    fits = []
+    for groups in selections:
+        try:
+            posegram_layout(Body_Dict,root_id,groups).rel_offset(gram)
+            fits.append(groups)
+        except ValueError:
+            pass
+    if len(fits)!=1:
+        raise ValueError('The joint groups of a posegram of %d rows are %s, pass them explicitly'
+                         % (gram.shape[0],'unknown' if not fits else 'one of '+' or '.join(str(f) for f in fits)))
+    return fits[0]
+
+def select_joint_groups(Body_Dict=COCO_BODY_TREE, groups=None):
+    #Body_Dict without the joints of the groups not selected, built once per selection.
+    #The body is always kept, the hands hang from the elbows and the face from the root
+    if groups is None or set(groups) >= set(JOINT_GROUPS):
+        return Body_Dict
+    unknown = set(groups) - set(JOINT_GROUPS)
+    if unknown:
+        raise ValueError('Unknown joint groups %s, the groups are %s' % (sorted(unknown),', '.join(JOINT_GROUPS)))
+    groups = tuple(g for g in JOINT_GROUPS if g in groups or g=='body')
+    key = (body_dict_key(Body_Dict),groups)
+    if key not in _GROUP_BODY_DICTS:
+        _GROUP_BODY_DICTS[key] = dict((k,[list(c for c in v[0] if joint_group(int(c)) in groups),v[1]])
+                                      for k, v in Body_Dict.items() if joint_group(int(k)) in groups)
+        _keep_body_dict_key(_GROUP_BODY_DICTS[key])
+    return _GROUP_BODY_DICTS[key]
 
 def distance_two_points(p1, p2):
     if all(p1)==False or all(p2)==False:
@@ -1418,6 +2057,13 @@ def get_rotation_mat(inp, tar):
 
     return np.dot(yr,zr)
 
+def nget_rotation_mat(inp, tar):
+    #batched get_rotation_mat: (frames,4) -> (frames,4,4)
+    rot_y, yr = ny_rot_m(inp,tar)
+    rot_z, zr = nz_rot_m(rot_y,tar)
+
+    return np.matmul(yr,zr)
+
 def get_face_rotation_mat(inp, tar, inp1006, tar1006):
     rot_x, xr = x_rot_m(inp,tar)
     rot_y, yr = y_rot_m(rot_x,tar) 
@@ -1426,11 +2072,21 @@ def get_face_rotation_mat(inp, tar, inp1006, tar1006):
     rot_z, zr = z_rot_m(inp1006,tar1006)
     return np.dot(np.dot(xr,yr),zr)
 
+def nget_face_rotation_mat(inp, tar, inp1006, tar1006):
+    #batched get_face_rotation_mat: (frames,4) -> (frames,4,4)
+    tar1006 = np.broadcast_to(tar1006,inp1006.shape)
+    rot_x, xr = nx_rot_m(inp,tar)
+    rot_y, yr = ny_rot_m(rot_x,tar)
+    xyr = np.matmul(xr,yr)
+    inp1006 = nrotate(inp1006,xyr)
+    rot_z, zr = nz_rot_m(inp1006,tar1006)
+    return np.matmul(xyr,zr)
+
 def angle_rad(v1, v2):
     up = np.dot(v1, v2)
     down = (np.linalg.norm(v1)*np.linalg.norm(v2))  + 0.0000000001
 
-    angle = np.arccos(up/down)        
+    angle = np.arccos(np.clip(up/down,-1,1))        
     return angle
 
 def x_rot_m(inp,tar):
@@ -1508,6 +2164,67 @@ def z_rot_m(inp,tar):
 
     return rot_z, zr
 
+def rot_mtrxs(angles, axis):
+    #stack of 4x4 rotation matrices around x(0), y(1) or z(2), one per angle -> (frames,4,4)
+    c, s = np.cos(angles), np.sin(angles)
+    rot = np.zeros((angles.shape[0],4,4),dtype=angles.dtype)
+    rot[:,0,0] = rot[:,1,1] = rot[:,2,2] = rot[:,3,3] = 1
+    if axis==0:
+        rot[:,1,1], rot[:,1,2], rot[:,2,1], rot[:,2,2] = c, -s, s, c
+    elif axis==1:
+        rot[:,0,0], rot[:,0,2], rot[:,2,0], rot[:,2,2] = c, s, -s, c
+    else:
+        rot[:,0,0], rot[:,0,1], rot[:,1,0], rot[:,1,1] = c, -s, s, c
+    return rot
+
+def nangle_rad(v1, v2):
+    #batched angle_rad along the last axis
+    up = np.sum(v1*v2,axis=-1)
+    down = (np.linalg.norm(v1,axis=-1)*np.linalg.norm(v2,axis=-1))  + 0.0000000001
+
+    angle = np.arccos(np.clip(up/down,-1,1))
+    return angle
+
+def nx_rot_m(inp,tar):
+    x = nangle_rad(inp[:,1:3],tar[:,1:3])
+    rot_x = nrotate(inp,rot_mtrxs(x,0))
+    x2 = nangle_rad(rot_x[:,1:3],tar[:,1:3])
+
+    x = np.where(x<x2,-x,x)
+    xr = rot_mtrxs(x,0)
+    rot_x = nrotate(inp,xr)
+    return rot_x, xr
+
+def ny_rot_m(inp,tar):
+    y = nangle_rad(inp[:,[0,2]],tar[:,[0,2]])
+    rot_y = nrotate(inp,rot_mtrxs(y,1))
+    y2 = nangle_rad(rot_y[:,[0,2]],tar[:,[0,2]])
+
+    y = np.where(y<y2,-y,y)
+    yr = rot_mtrxs(y,1)
+    rot_y = nrotate(inp,yr)
+    return rot_y, yr
+
+def nz_rot_m(inp,tar):
+    z = nangle_rad(inp[:,:2],tar[:,:2])
+    rot_z = nrotate(inp,rot_mtrxs(z,2))
+    z2 = nangle_rad(rot_z[:,:2],tar[:,:2])
+
+    z = np.where(z<z2,-z,z)
+    zr = rot_mtrxs(z,2)
+    rot_z = nrotate(inp,zr)
+    return rot_z, zr
+
+def nrotate(inp, rot):
+    #inp (frames,4) or (frames,joints,4), rot (frames,4,4)
+    out = np.einsum('f...i,fij->f...j',inp,rot)
+    return out
+
+def nscale(inp, scale_coeffs):
+    scale_coeffs = np.reshape(scale_coeffs,(-1,)+(1,)*(inp.ndim-1))
+    out = inp[...,:3]*scale_coeffs
+    return out
+
 def rotate(inp, rot):
     out = np.dot(inp,rot)
     return out
@@ -1521,58 +2238,56 @@ def scale(inp,scale_coeff):
 
     return out[:3]
 
-def mp_frame_coords(landmarks, H, W, extra_pose_lm=None):
+_LANDMARK_FIELDS = operator.attrgetter('x','y','z','visibility')
+_WORLD_FIELDS = operator.attrgetter('x','y','z')
+
+def mp_frame_coords(landmarks, H, W, extra_pose_lm=None, out=None):
+    #all the landmarks at once -> (landmarks,4), or (landmarks,7) with the pose world landmarks,
+    #written into out (e.g. MP_Face[fr]) if given.
+    #The protobuf lists have no array access, the fields are read by C getters straight into the buffer
+    n = len(landmarks.landmark)
+    if out is None:
+        out = np.zeros((n,7 if extra_pose_lm else 4))
+    coord = out[:n,:4]
+    coord[:] = np.fromiter(itertools.chain.from_iterable(map(_LANDMARK_FIELDS,landmarks.landmark)),dtype=float,count=4*n).reshape(n,4)
+    coord *= (W,H,-W,1)
     if extra_pose_lm:
-        coord = np.zeros((len(landmarks.landmark),7))
-        for i in range(len(landmarks.landmark)):
-            coord[i][0] = (landmarks.landmark[i].x * W)
-            coord[i][1] = (landmarks.landmark[i].y * H)
-            coord[i][2] = (-landmarks.landmark[i].z * W)
-            coord[i][3] = (landmarks.landmark[i].visibility)
-            coord[i][4] = extra_pose_lm.landmark[i].x * 100
-            coord[i][5] = extra_pose_lm.landmark[i].y * 100
-            coord[i][6] = -extra_pose_lm.landmark[i].z * 100
-    else:
-        coord = np.zeros((len(landmarks.landmark),4))
-        for i in range(len(landmarks.landmark)):
-            coord[i][0] = (landmarks.landmark[i].x * W)
-            coord[i][1] = (landmarks.landmark[i].y * H)
-            coord[i][2] = (-landmarks.landmark[i].z * W)
-            coord[i][3] = (landmarks.landmark[i].visibility)
-    return coord
-
-def angle_to_uint8(angle):
-    x = (angle * 128)/np.pi +128 
-    x = np.where(x < 255, x, np.array([255 for i in range(x.shape[0])]))
-    return x
+        n = len(extra_pose_lm.landmark)
+        world = out[:n,4:7]
+        world[:] = np.fromiter(itertools.chain.from_iterable(map(_WORLD_FIELDS,extra_pose_lm.landmark)),dtype=float,count=3*n).reshape(n,3)
+        world *= (100,100,-100)
+    return out
+
+def angle_to_uint8(angle, out=None):
+    #any shape, radians -> uint8, written into out if given
+    x = (np.asarray(angle) * 128)/np.pi +128 
+    x = np.where(x < 255, x, 255)
+    if out is None:
+        return x.astype(np.uint8)
+    out[...] = x
+    return out
 
 def uint8_to_angle(int8):
     angle = (int8-128)/128 * np.pi
     return angle
 
-def relative_angle_to_RGB_uint8(angle):
-
-    R,G,B = np.zeros_like(angle),np.zeros_like(angle),np.zeros_like(angle)
+def relative_angle_to_RGB_uint8(angle, out=None):
+    #any shape -> shape+(3,) uint8, written into out if given
     #b for 0, r for 90, g for 180
-    for i in range(angle.shape[0]):
-        if angle[i] > (np.pi*0.5):
-
-            R[i] = abs(np.sin(angle[i])*255)
-            G[i] = abs(np.cos(angle[i])*255)
-            B[i] = 0
-        else:
-
-            R[i] = abs(np.sin(angle[i])*255)
-            G[i] = 0
-            B[i] = abs(np.cos(angle[i])*255)
+    angle = np.asarray(angle)
+    if out is None:
+        out = np.zeros(angle.shape+(3,),dtype=np.uint8)
+    cos = abs(np.cos(angle)*255)
+    obtuse = angle > (np.pi*0.5)
+
+    out[...,0] = abs(np.sin(angle)*255)
+    out[...,1] = np.where(obtuse,cos,0)
+    out[...,2] = np.where(obtuse,0,cos)
             
-    return np.vstack((R,G,B)).T
+    return out
 
 def signal_to_uint(signal_gram):
-    rgb_gram = np.zeros_like(signal_gram)
-    for s in range(signal_gram.shape[0]):
-        rgb_gram[s] = angle_to_uint8(signal_gram[s])
-    rgb_gram = rgb_gram.astype(np.uint8)
+    rgb_gram = angle_to_uint8(signal_gram)
     return rgb_gram
 
 def uint_to_signal(rgb_gram):
@@ -1581,44 +2296,119 @@ def uint_to_signal(rgb_gram):
         signal_gram[s] = uint8_to_angle(rgb_gram[s])
     return signal_gram
 
-def interpolate_zeros(inp):       
-    xp = np.nonzero(inp)[0]
-    all_xp = np.arange(len(inp))
-    x = np.array([a for a in all_xp if a not in xp]).astype(int)
-    fp = inp[np.nonzero(inp)[0].astype(int)]
-    iterp = np.interp(x,xp,fp)
-    inp[x] = iterp
-    return inp
-
-def make_a_video(m, out_path):
-    X_DIMENSION = 600
-    Y_DIMENSION = 600
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    out = cv2.VideoWriter(out_path, fourcc, 60, (X_DIMENSION, Y_DIMENSION))
-    total = m.rotated_coords.shape[0]
-    
-    for fr in range(total):
-
-        black_image = np.zeros((X_DIMENSION, Y_DIMENSION,3),dtype=np.uint8)
-        black_image = m._draw_tree(black_image,fr,True,[],add_face=True)
-        black_image = cv2.cvtColor(black_image.astype(np.uint8),cv2.COLOR_BGR2RGB)
-        out.write(black_image)
-
-        #if ((fr/total)*100)%10==0:
-        #    print('Progress ',(int((fr/total)*100)), "%")
-    out.release()
+def interpolate_zeros(inp, max_gap=None, axis=0, segments=None):
+    #fills the zeros along axis linearly from the nearest non zero values (held constant at the edges),
+    #every other axis is a separate series, e.g. a (frames,joints,3) block;
+    #gaps longer than max_gap frames are left as zeros
+    #segments: (clips+1,) first frame of every clip of a batch, the values are never taken across clips
+    data = np.moveaxis(np.asarray(inp),axis,0)
+    n = data.shape[0]
+    valid = data!=0
+    idx = np.arange(n).reshape((-1,)+(1,)*(data.ndim-1))
+    start, stop = _segment_bounds(n,segments,data.ndim)
+
+    before = np.maximum.accumulate(np.where(valid,idx,-1),axis=0)
+    after = np.flip(np.minimum.accumulate(np.flip(np.where(valid,idx,n),axis=0),axis=0),axis=0)
+    has_before = before>=start
+    has_after = after<stop
+    p = np.clip(np.where(has_before,before,after),start,stop-1)
+    q = np.clip(np.where(has_after,after,before),start,stop-1)
+    fp = np.take_along_axis(data,p,axis=0)
+    fq = np.take_along_axis(data,q,axis=0)
+
+    span = np.where(q>p,q-p,1)
+    filled = (fq-fp)/span*(idx-p) + fp
+
+    fill = (valid==False) & (has_before | has_after)
+    if max_gap is not None:
+        gap = np.where(has_before & has_after,after-before-1,np.where(has_before,stop-1-before,after-start))
+        fill = fill & (gap<=max_gap)
+
+    out = np.where(fill,filled,data)
+    if isinstance(inp,np.ndarray):
+        inp[...] = np.moveaxis(out,0,axis)
+        return inp
+    return np.moveaxis(out,0,axis)
+
+def make_a_video(m, out_path, size=600, workers=None):
+    return render_video(m,out_path,60,size,workers=workers)
     
 def smooth_out(inp, win_size=10, times=1, weights=[]):
-    out = inp
-    w_ = weights
+    if len(weights)!=len(inp):
+        weights = None
+    return smooth(inp,win_size,times,weights)
+
+def smooth(inp, win_size=10, times=1, weights=None, axis=0, segments=None):
+    #moving average with the window() edge padding (second frame at the start, last frame at the end),
+    #along any axis of an array, in linear time with cumulative sums
+    #segments: (clips+1,) first frame of every clip of a batch, every clip is smoothed on its own
+    out = np.moveaxis(np.array(inp,dtype=float),axis,0)
+    h = win_size//2
+    if h==0 or out.shape[0]==0:
+        return np.moveaxis(out,0,axis)
+    if weights is not None:
+        w = np.asarray(weights,dtype=float)
+        if w.ndim==1:
+            w = w.reshape((-1,)+(1,)*(out.ndim-1))
+        w = np.broadcast_to(w,out.shape)
+    if segments is not None:
+        for i in range(times):
+            out = _smooth_segments(out,win_size,segments,None if weights is None else w)
+        return np.moveaxis(out,0,axis)
+
     for i in range(times):
-        win = window(out,win_size)
-        if len(w_)!=len(inp):
-            out  = list(np.average(w) for w in win )
+        if out.shape[0] < 2*h:
+            #too short for the padding, the windows are taken as window() builds them
+            out = _smooth_short(out,win_size,None if weights is None else w)
+        elif weights is None:
+            out = _window_sums(out,h)/(2*h)
         else:
-            w_win = window(w_,win_size)
-            out  = list(np.average(win[i],weights=w_win[i]) for i in range(len(win)))
-            
+            out = _window_sums(out*w,h)/_window_sums(w,h)
+    return np.moveaxis(out,0,axis)
+
+def _window_sums(x, h):
+    #sums of the window() windows along the first axis
+    n = x.shape[0]
+    padded = np.concatenate((np.repeat(x[1:2],h,axis=0),x,np.repeat(x[-1:],h,axis=0)),axis=0)
+    sums = np.zeros((padded.shape[0]+1,)+x.shape[1:])
+    np.cumsum(padded,axis=0,out=sums[1:])
+    return sums[2*h:2*h+n] - sums[:n]
+
+def _segment_bounds(n, segments, ndim=1):
+    #first and last+1 frame of the clip of every frame, shaped to broadcast over (frames,...)
+    if segments is None:
+        return 0, n
+    segments = np.asarray(segments)
+    clip = np.repeat(np.arange(len(segments)-1),np.diff(segments))
+    shape = (-1,)+(1,)*(ndim-1)
+    return segments[:-1][clip].reshape(shape), segments[1:][clip].reshape(shape)
+
+def _smooth_segments(x, win_size, segments, w=None):
+    #clips of the same length are smoothed together as the columns of one (length,clips,...) block,
+    #with the same arithmetic as a single clip; single frames are kept
+    h = win_size//2
+    segments = np.asarray(segments)
+    starts, lengths = segments[:-1], np.diff(segments)
+    out = np.array(x)
+    for n in np.unique(lengths):
+        if n<2:
+            continue
+        frames = np.arange(n)[:,None] + starts[lengths==n][None]
+        block = x[frames]
+        if n < 2*h:
+            out[frames] = _smooth_short(block,win_size,None if w is None else w[frames])
+        elif w is None:
+            out[frames] = _window_sums(block,h)/(2*h)
+        else:
+            out[frames] = _window_sums(block*w[frames],h)/_window_sums(w[frames],h)
+    return out
+
+def _smooth_short(x, win_size, w=None):
+    out = np.zeros(x.shape)
+    windows = window(np.arange(x.shape[0]),win_size)
+    for i in range(len(windows)):
+        idx = np.array(windows[i],dtype=int)
+        out[i] = np.average(x[idx],axis=0,weights=None if w is None else w[idx])
     return out
 
 def resize_sample(gram, arg):
@@ -1646,29 +2436,29 @@ def resize_sample_as_target(gram, target_gram):
         res_gram[i] = np.interp(np.arange(0, target_gram.shape[1]), np.arange(0, gram[i].shape[0])*factor, gram[i])
     return res_gram
 
-def trim_posegram(pg):
-    #remove face and relative joint data from the gram
-    if pg.shape[0]==455:
-        pg = pg[44:]
-    pg = np.concatenate((pg[:53],pg[53+84:84+2*53],pg[2*84+2*53:2*84+3*53]),axis=0)
-    return pg
-
-def add_to_trimmed(pg, ex):
+def trim_posegram(pg, layout=None):
+    #remove face and relative joint data from the gram -> (3*trimmed joints,frames) x, y and z rows,
+    #(trimmed joints,frames,3) for human posegrams
+    if layout is None:
+        layout = posegram_layout()
+    trimmed = layout.trim(pg)
+    if pg.ndim==3:
+        return trimmed
+    return trimmed.reshape((-1,)+trimmed.shape[2:])
+
+def add_to_trimmed(pg, ex, layout=None):
     #add face and relative joint data from the example gram
-    #print(ex.shape)
+    if layout is None:
+        layout = posegram_layout()
     exp = np.copy(ex)
-    #print(exp.shape)
-    if exp.shape[0]==455:
-        r = 44
-    else:
-        r = 0
 
     if exp.shape[1] != pg.shape[1]:
-        exp.resize((exp.shape[0], pg.shape[1]))
-    #print(exp.shape)
-    exp[r:r+53] = pg[:53]#adding x
-    exp[r+53+84:r+53*2+84] = pg[53:53*2]#adding y
-    exp[r+53*2+84*2:r+53*3+84*2] = pg[53*2:53*3]#adding z
+        exp.resize((exp.shape[0], pg.shape[1])+exp.shape[2:])
+    #x, y and z rows of the trimmed joints, one RGB row per joint in human posegrams
+    if exp.ndim==3:
+        layout.trim(exp)[:] = pg
+    else:
+        layout.trim(exp)[:] = pg.reshape((3,layout.trimmed)+pg.shape[1:])
 
     return exp
 
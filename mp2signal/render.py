@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Mediapipe To Signal Tool.
+Batched renderer of processed movements.
+The screen coordinates, colors and labels of the whole clip are computed at once from the stage arrays of the tree,
+the frames are then drawn in worker processes and written to the video in order.
+The frames are the same as the ones of Joint_Tree._draw_tree(image,fr,True,[],add_face=True).
+
+Copyright (C) 2021-2023, Victor Skobov
+All rights reserved. E-mail: <vskobov@gmail.com>.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import multiprocessing
+import os
+import cv2
+import numpy as np
+
+#the drawing of _draw_tree was made for 600x600 frames, other sizes scale the coordinates
+BASE_SIZE = 600
+FACE_INSET = 0.35
+#clips shorter than this are drawn in the calling process
+RENDER_MIN_POOL_FRAMES = 120
+
+def render_plan(m, size=BASE_SIZE, add_face=True):
+    #everything the frames need, as (frames,joints,...) arrays in the preorder of the tree
+    sk = m.skeleton
+    joints = list(m)
+    ids = sk.ids
+    scale = size/BASE_SIZE
+    center = np.array([size/2,size/2],dtype=int)
+
+    rotated = sk.stage('rotated_coords')
+    frames = rotated.shape[0]
+    ends = center + rotated[:,:,:2]*scale
+    valid = np.all(np.isfinite(ends),axis=2)
+    ends = np.where(valid[:,:,None],ends,0).astype(int)
+
+    dot_colors = sk.stage('color').astype(int)
+    line_colors = dot_colors.copy()
+    degrees = np.full((frames,len(joints)),np.nan)
+    for k, j in enumerate(joints):
+        if j.level>=3 and hasattr(j,'relative_color'):
+            line_colors[:,k] = j.relative_color
+            degrees[:,k] = np.degrees(j.rel_a)
+
+    #the styles of _draw_tree
+    dot_only = (ids==1)|(ids>999)
+    radius = np.where((ids>999)|((ids>400)&(ids<811)),2,3)
+    labeled = (ids!=1)&((ids<=400)|(ids>=811))&(ids<=999)
+
+    #(parent, dot only, dot radius, label or '') of every joint, read once per frame
+    styles = list(zip(sk.parent_index.tolist(),dot_only.tolist(),radius.tolist(),
+                      list(str(i) if l else '' for i, l in zip(ids.tolist(),labeled.tolist()))))
+
+    #trees without the face group have no face inset
+    add_face = add_face and m[999] is not None
+    plan = {'size':size,'frames':frames,'ends':ends,'valid':valid,'styles':styles,
+            'dot_colors':dot_colors,'line_colors':line_colors,'degrees':degrees,'add_face':add_face}
+    if add_face:
+        face = np.array(list(sk.index[j.id] for j in m[999].children))
+        face_ends = center + sk.stage('face_rotated_coords',face)[:,:,:2]*2.5*scale
+        plan['face_valid'] = np.all(np.isfinite(face_ends),axis=2)
+        plan['face_ends'] = np.where(plan['face_valid'][:,:,None],face_ends,0).astype(int)
+        plan['face'] = face
+    return plan
+
+def _dot(image, x, y, r, color):
+    #as the dots of _draw_joint, dots crossing the border are not drawn
+    region = image[y-r:y+r,x-r:x+r]
+    if region.shape[0]==2*r and region.shape[1]==2*r:
+        region[:] = color
+
+def draw_frame(plan, fr):
+    size = plan['size']
+    image = np.zeros((size,size,3),dtype=np.uint8)
+    ends = plan['ends'][fr].tolist()
+    valid = plan['valid'][fr].tolist()
+    dot_colors = plan['dot_colors'][fr].tolist()
+    line_colors = plan['line_colors'][fr].tolist()
+    degrees = plan['degrees'][fr].tolist()
+    for k, (p, dot_only, r, label) in enumerate(plan['styles']):
+        if not valid[k]:
+            continue
+        x, y = ends[k]
+        if not dot_only:
+            if not valid[p]:
+                continue
+            try:
+                cv2.line(image,tuple(ends[p]),(x,y),tuple(line_colors[k]),2)
+            except cv2.error:
+                continue
+        _dot(image,x,y,r,dot_colors[k])
+        if label:
+            text = label if degrees[k]!=degrees[k] else label+" "+str(round(degrees[k]))
+            cv2.putText(image,text,(x+10,y-10),cv2.FONT_HERSHEY_SIMPLEX,0.4,(255,255,255))
+
+    cv2.putText(image,str(['Frame:', fr]),(30,50),cv2.FONT_HERSHEY_SIMPLEX,0.6,(0,0,0))
+
+    if plan['add_face']:
+        img_face = np.zeros_like(image)
+        face_ends = plan['face_ends'][fr].tolist()
+        face_valid = plan['face_valid'][fr].tolist()
+        face_colors = plan['dot_colors'][fr][plan['face']].tolist()
+        for k in range(len(face_ends)):
+            if face_valid[k]:
+                _dot(img_face,face_ends[k][0],face_ends[k][1],5,face_colors[k])
+        img_face = cv2.resize(img_face,(int(size*FACE_INSET),int(size*FACE_INSET)))
+        image[:img_face.shape[0],-img_face.shape[1]:] = img_face
+    return image
+
+#the plan of the clip rendered by a worker process
+_worker = {}
+
+def _init_worker(plan):
+    _worker['plan'] = plan
+
+def _draw_rgb(fr):
+    return cv2.cvtColor(draw_frame(_worker['plan'],fr),cv2.COLOR_BGR2RGB)
+
+def render_frames(m, size=BASE_SIZE, add_face=True, workers=None, chunksize=16):
+    #yields the RGB frames of the clip in order, drawn by workers processes (in this process when it is daemonic)
+    plan = render_plan(m,size,add_face)
+    if workers is None:
+        workers = os.cpu_count()
+    #daemonic processes (e.g. Pool workers rendering samples in bulk) can not start a pool of their own
+    if workers<=1 or plan['frames']<RENDER_MIN_POOL_FRAMES or multiprocessing.current_process().daemon:
+        for fr in range(plan['frames']):
+            yield cv2.cvtColor(draw_frame(plan,fr),cv2.COLOR_BGR2RGB)
+        return
+    with multiprocessing.Pool(workers,initializer=_init_worker,initargs=(plan,)) as pool:
+        for image in pool.imap(_draw_rgb,range(plan['frames']),chunksize):
+            yield image
+
+def render_video(m, out_path, fps=60, size=BASE_SIZE, add_face=True, workers=None):
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    out = cv2.VideoWriter(out_path, fourcc, fps, (size, size))
+    frames = 0
+    for image in render_frames(m,size,add_face,workers):
+        out.write(image)
+        frames += 1
+    out.release()
+    return frames
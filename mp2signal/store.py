@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""
+Mediapipe To Signal Tool.
+Columnar posegram store for large corpora.
+All the posegram columns of a corpus are kept in one memory-mapped file, frame after frame, with an offsets index
+and the metadata of every clip, so a clip is a zero-copy slice and opening the corpus reads only the index.
+
+Copyright (C) 2021-2023, Victor Skobov
+All rights reserved. E-mail: <vskobov@gmail.com>.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import os
+import joblib
+import numpy as np
+
+STORE_DATA = 'columns.bin'
+STORE_OFFSETS = 'offsets.npy'
+STORE_META = 'meta.json'
+
+#posegram forms: dtype of the stored columns and the channels of one row
+STORE_FORMS = {'uint8':(np.uint8,()),
+               'float':(np.float32,()),
+               'human':(np.uint8,(3,))}
+
+class Posegram_Store:
+    #<path>/columns.bin (frames,rows[,3]) all clips one after another, offsets.npy (clips+1,) first frame of every clip,
+    #meta.json the form, rows, joint groups and [id, source, FPS, Frames] of every clip.
+    #mode 'r' reads, 'a' also appends (creating the store with form and groups if missing, the rows are taken from the
+    #first clip). groups: joint groups of the posegrams (see mp2s.Joint_Tree), None for the whole tree
+    def __init__(self, path, mode='r', form='uint8', groups=None):
+        self.path = path
+        self.mode = mode
+        meta_path = os.path.join(path,STORE_META)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            self.offsets = np.load(os.path.join(path,STORE_OFFSETS))
+            #the two index files are replaced one after the other, only the clips in both are kept
+            n = min(len(self.meta['clips']),len(self.offsets)-1)
+            self.meta['clips'] = self.meta['clips'][:n]
+            self.offsets = self.offsets[:n+1]
+        elif mode == 'a':
+            if form not in STORE_FORMS:
+                raise ValueError('form must be one of '+', '.join(STORE_FORMS))
+            os.makedirs(path,exist_ok=True)
+            self.meta = {'form':form,'rows':None,'groups':list(groups) if groups else None,'clips':[]}
+            self.offsets = np.zeros(1,dtype=np.int64)
+            open(os.path.join(path,STORE_DATA),'wb').close()
+            self._write_index()
+        else:
+            raise FileNotFoundError('No posegram store at '+path)
+        if mode == 'a' and groups and sorted(groups) != sorted(self.groups or []):
+            raise ValueError('The store holds posegrams of the joint groups %s, not %s' % (self.groups,list(groups)))
+
+        dtype, self.channels = STORE_FORMS[self.meta['form']]
+        self.dtype = np.dtype(dtype)
+        self.ids = dict((c['id'],k) for k, c in enumerate(self.meta['clips']))
+        self._data = None
+        self._dirty = False
+        if mode == 'a':
+            #columns of an interrupted append that never made it into the index are dropped
+            with open(os.path.join(path,STORE_DATA),'r+b') as f:
+                f.truncate(int(self.offsets[-1])*self._column_bytes() if self.meta['rows'] else 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    @property
+    def groups(self):
+        #stores made before the groups were recorded hold whole tree posegrams, or the groups follow from the rows
+        return self.meta.get('groups')
+
+    @property
+    def column_shape(self):
+        return (self.meta['rows'],)+self.channels
+
+    def __len__(self):
+        return len(self.meta['clips'])
+
+    def __contains__(self, clip_id):
+        return clip_id in self.ids
+
+    def __getitem__(self, key):
+        #clip number or id -> (rows,frames) or (rows,frames,3) posegram, a view into the memory-mapped file
+        k = self.ids[key] if isinstance(key,str) else key
+        columns = self.data()[self.offsets[k]:self.offsets[k+1]]
+        return np.moveaxis(columns,0,1)
+
+    def clip_meta(self, key):
+        return self.meta['clips'][self.ids[key] if isinstance(key,str) else key]
+
+    def data(self):
+        #(frames,rows[,3]) columns of the whole corpus
+        if self._data is None:
+            shape = (int(self.offsets[-1]),)+self.column_shape
+            if shape[0]==0:
+                self._data = np.zeros(shape,dtype=self.dtype)
+            else:
+                self._data = np.memmap(os.path.join(self.path,STORE_DATA),dtype=self.dtype,mode='r',shape=shape)
+        return self._data
+
+    def movement(self, key, groups=None):
+        #groups: joint groups of the posegrams when the store does not record them and the rows do not tell
+        import mp2signal.mp2s as mp2s
+        gram = self[key]
+        groups = groups or self.groups or mp2s.posegram_joint_groups(gram)
+        return mp2s.Movement(gram,verbose=False,groups=groups)
+
+    def append(self, gram, clip_id, source=None, fps=None):
+        #gram: (rows,frames) or (rows,frames,3) in the form of the store
+        #the index is written by flush(), not on every clip
+        if self.mode != 'a':
+            raise IOError('Posegram store is opened read only')
+        if clip_id in self.ids:
+            raise KeyError('Clip %s is already in the store' % clip_id)
+        columns = np.moveaxis(np.asarray(gram),1,0)
+        if self.meta['rows'] is None:
+            self.meta['rows'] = int(columns.shape[1])
+        if columns.shape[1:] != self.column_shape:
+            raise ValueError('Posegram columns %s do not match the store %s' % (columns.shape[1:],self.column_shape))
+        if self.dtype == np.uint8 and columns.dtype != np.uint8:
+            raise ValueError('A %s posegram can not be stored in a %s store' % (columns.dtype,self.meta['form']))
+        with open(os.path.join(self.path,STORE_DATA),'ab') as f:
+            f.write(np.ascontiguousarray(columns,dtype=self.dtype).tobytes())
+        self.offsets = np.append(self.offsets,self.offsets[-1]+columns.shape[0])
+        self.ids[clip_id] = len(self.meta['clips'])
+        self.meta['clips'].append({'id':clip_id,'source':source,'FPS':fps,'Frames':int(columns.shape[0])})
+        self._data = None
+        self._dirty = True
+
+    def flush(self):
+        #the appended clips become visible to readers once the index is written
+        if self._dirty:
+            self._write_index()
+            self._dirty = False
+
+    def _column_bytes(self):
+        return int(np.prod(self.column_shape))*self.dtype.itemsize
+
+    def _write_index(self):
+        #index files are replaced, never rewritten in place
+        for name, save in ((STORE_OFFSETS,lambda f: np.save(f,self.offsets)),
+                           (STORE_META,lambda f: f.write(json.dumps(self.meta).encode()))):
+            tmp = os.path.join(self.path,name+'.tmp')
+            with open(tmp,'wb') as f:
+                save(f)
+            os.replace(tmp,os.path.join(self.path,name))
+
+def build_store(store_path, inputs, form='uint8', verbose=True, flush_every=1000, groups=None):
+    #appends .npy posegrams and .joblib landmark dicts (files or directories searched recursively) to the store,
+    #clips already in it are skipped, so an interrupted build is resumed.
+    #groups: joint groups the landmarks are processed with, the .npy posegrams must have the same ones
+    import mp2signal.mp2s as mp2s
+    files = []
+    for inp in inputs:
+        if os.path.isdir(inp):
+            for ext in ('.npy','.joblib'):
+                files += list([f[2],os.path.relpath(f[2],inp)[:-len(ext)]] for f in mp2s.get_files(inp,ext))
+        else:
+            files.append([inp,os.path.splitext(os.path.basename(inp))[0]])
+    files.sort()
+
+    store = Posegram_Store(store_path,'a',form,groups)
+    for k, (path, clip_id) in enumerate(files):
+        if clip_id in store:
+            continue
+        source, fps = path, None
+        if path.endswith('.joblib'):
+            mov_dict = joblib.load(path)
+            m = mp2s.Movement(mov_dict,verbose=False,outputs=[form],groups=groups)
+            gram = m.posegram(human=(form=='human'),signal=(form=='float'))
+            source = mov_dict['Meta']['Video Path']
+            fps = mov_dict['Meta']['FPS']
+        else:
+            gram = np.load(path)
+        store.append(gram,clip_id,source,fps)
+        if len(store) % flush_every == 0:
+            store.flush()
+        if verbose:
+            print('[%d/%d] %s' % (k+1,len(files),clip_id))
+    store.flush()
+    return store
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a memory-mapped posegram store from posegrams or landmarks')
+    parser.add_argument('store', help='store directory, created if missing')
+    parser.add_argument('inputs', nargs='+', help='.npy posegrams, .joblib landmarks and/or directories of them')
+    parser.add_argument('--form', choices=list(STORE_FORMS), default='uint8', help='posegram form of a new store')
+    parser.add_argument('--groups', nargs='+', default=None, help='joint groups of the posegrams (body, rhand, lhand, '
+                                                                 'face), all by default, as given to extract --groups')
+    args = parser.parse_args()
+
+    store = build_store(args.store,args.inputs,args.form,groups=args.groups)
+    print('Done: %d clips, %d frames' % (len(store),store.offsets[-1]))
+
+if __name__ == '__main__':
+    main()